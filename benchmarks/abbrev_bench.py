@@ -0,0 +1,38 @@
+"""Time abbreviating a column of names: re.sub with the pattern string, the
+compiled and cached abbrev, and abbrev_many.
+
+Run from the top of the repository:
+
+    python benchmarks/abbrev_bench.py [n_names]
+"""
+
+import random
+import re
+import sys
+import timeit
+
+import fixtures
+
+from common.abbreviations import OMIT_FORENAMES, abbrev, abbrev_many
+
+def abbrev_uncached(name):
+    pattern, replacement = OMIT_FORENAMES
+    return re.sub(pattern, replacement, name)
+
+def main():
+    n_names = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rand = random.Random(0)
+    names = [rand.choice(fixtures.COMPOSERS + fixtures.PERFORMERS)
+            for i in range(n_names)]
+    assert [abbrev_uncached(name) for name in names] == abbrev_many(names)
+
+    print(f'{n_names} names')
+    cases = (('re.sub', lambda: [abbrev_uncached(name) for name in names]),
+            ('abbrev', lambda: [abbrev(name) for name in names]),
+            ('abbrev_many', lambda: abbrev_many(names)))
+    for label, f in cases:
+        seconds = min(timeit.repeat(f, number=1, repeat=5))
+        print(f'{label:12} {seconds * 1000:8.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Compare a key operation that reads and writes LONG once per work with
+one that does so once per recording (operations.adjust_metadata_files).
+
+Run from the top of the repository:
+
+    python benchmarks/adjust_bench.py [n_recordings] [works_per_recording]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import fixtures
+
+from common.constants import SHORT
+import common.checkpoint as checkpoint
+import common.shortfile as shortfile
+
+# The operation rearrange_primary, moving the first key to the end.
+LOCAL_VARS = {'from_index': 0,
+        'insert_index': len(fixtures.PRIMARY_KEYS) - 1}
+
+# How adjust_metadata_files worked before: each work loads and stores its
+# whole recording.
+def adjust_per_work(genre, op, local_vars):
+    short_file_path = Path(SHORT, genre)
+    short_columns = shortfile.read_columns(short_file_path)
+    values = []
+    with checkpoint.journaled() as recording_shelf:
+        for uuid, work_num in zip(short_columns.uuids,
+                short_columns.work_nums):
+            recording_tuple = recording_shelf[uuid]
+            values.append(op.long_step(recording_tuple, work_num,
+                    local_vars))
+            recording_shelf[uuid] = recording_tuple
+    columns = op.short_step(short_columns.columns, values, local_vars)
+    shortfile.write_columns(short_file_path,
+            short_columns._replace(columns=columns))
+
+def main():
+    n_recordings = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    works_per_recording = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    os.chdir(tempfile.mkdtemp())
+    try:
+        # A single genre, so that every work of a recording is rewritten.
+        fixtures.GENRES = ('Concerto',)
+        fixtures.make_database(n_recordings, works_per_recording)
+
+        # Config is read on import, so import after the database exists.
+        from operations import operations, adjust_metadata_files
+        checkpoint.remove_checkpoints()
+        op = operations['rearrange_primary']
+        print(f'{n_recordings} recordings of {works_per_recording} works')
+
+        for label, adjust in (('per work', adjust_per_work),
+                ('per recording', adjust_metadata_files)):
+            start = time.perf_counter()
+            adjust('Concerto', op, LOCAL_VARS)
+            print(f'{label:16} {time.perf_counter() - start:8.3f} s')
+    finally:
+        shutil.rmtree(os.getcwd())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Compare checkpoint push/pop cost: copytree, hard links, and xz.
+
+Run from the top of the repository:
+
+    python benchmarks/checkpoint_bench.py [n_recordings]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fixtures import make_database, disk_use
+
+from common.constants import LONG, METADATA
+import common.checkpoint as checkpoint
+
+# A checkpoint that copies (or compresses) LONG and one that links it.
+CASES = (('LONG copied', [LONG]), ('LONG linked', []))
+
+def copytree_push_pop():
+    dest = Path(checkpoint.CHECKPOINTS, 'copytree')
+    start = time.perf_counter()
+    shutil.copytree(METADATA, dest)
+    push = time.perf_counter() - start
+    size = disk_use(dest)
+
+    start = time.perf_counter()
+    shutil.rmtree(METADATA)
+    dest.rename(METADATA)
+    pop = time.perf_counter() - start
+    return push, pop, size
+
+def checkpoint_push_pop(touched):
+    start = time.perf_counter()
+    checkpoint.push_checkpoint('benchmark', touched)
+    checkpoint.wait()
+    push = time.perf_counter() - start
+    size = disk_use(checkpoint.CHECKPOINTS) \
+            - os.path.getsize(checkpoint.MANIFEST)
+
+    start = time.perf_counter()
+    checkpoint.pop_checkpoint()
+    pop = time.perf_counter() - start
+    return push, pop, size
+
+def main():
+    n_recordings = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    os.chdir(tempfile.mkdtemp())
+    try:
+        make_database(n_recordings)
+        checkpoint.remove_checkpoints()
+        print(f'{n_recordings} recordings, METADATA is '
+                f'{disk_use(METADATA) / 2**20:.1f} MiB')
+        print(f'{"method":32} {"push (s)":>9} {"pop (s)":>9} '
+                f'{"disk (MiB)":>11}')
+
+        def report(label, push, pop, size):
+            print(f'{label:32} {push:9.3f} {pop:9.3f} {size / 2**20:11.2f}')
+
+        report('copytree', *copytree_push_pop())
+        for compress in (False, True):
+            checkpoint.compress = compress
+            for label, touched in CASES:
+                label = f'{"xz" if compress else "links"}, {label}'
+                report(label, *checkpoint_push_pop(touched))
+    finally:
+        shutil.rmtree(os.getcwd())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Build a synthetic recordings database for the benchmarks."""
+
+import os
+import pickle
+import random
+import shelve
+import sys
+from pathlib import Path
+
+# The benchmarks import modules from the top of the repository.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common.constants import CONFIG, COMPLETERS, LONG, SHORT
+from common.types import RecordingTuple, WorkTuple, TrackTuple
+
+GENRES = ('Concerto', 'Symphony', 'Opera', 'Chamber', 'Jazz')
+PRIMARY_KEYS = ['composer', 'work', 'performer']
+SECONDARY_KEYS = ['conductor', 'ensemble']
+COMPOSERS = ['Johann Sebastian Bach', 'Ludwig van Beethoven',
+        'Wolfgang Amadeus Mozart', 'Franz Schubert', 'Johannes Brahms',
+        'Martin Luther King Jr.', 'Pyotr Ilyich Tchaikovsky']
+PERFORMERS = ['Glenn Gould', 'Martha Argerich', 'Itzhak Perlman',
+        'Yo-Yo Ma', 'Daniel Barenboim', 'Anne-Sophie Mutter']
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+        'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+def random_date(rand):
+    if rand.random() < 0.2:
+        return ''
+    return f'{rand.randint(2000, 2025)} {rand.choice(MONTHS)} ' \
+            f'{rand.randint(1, 28):02d}'
+
+# Create DATABASE under root (the caller should chdir to root first) with
+# n_recordings recordings of works_per_recording works each.
+def make_database(n_recordings, works_per_recording=4, seed=0):
+    rand = random.Random(seed)
+    Path(SHORT).mkdir(parents=True)
+    Path(COMPLETERS).mkdir(parents=True)
+    for name in ('composer', 'performer'):
+        names = COMPOSERS if name == 'composer' else PERFORMERS
+        Path(COMPLETERS, name).write_text('\n'.join(names) + '\n')
+
+    all_keys = PRIMARY_KEYS + SECONDARY_KEYS
+    short_files = {genre: open(Path(SHORT, genre), 'wb') for genre in GENRES}
+    with shelve.open(str(LONG), 'n') as recording_shelf:
+        for n in range(n_recordings):
+            uuid = f'{n:08x}-0000-4000-8000-{rand.getrandbits(48):012x}'
+            tracks = [TrackTuple(1, i + 1, f'Track {i + 1}', 300.0)
+                    for i in range(works_per_recording * 3)]
+            works = {}
+            for work_num in range(works_per_recording):
+                genre = rand.choice(GENRES)
+                metadata = [(rand.choice(COMPOSERS),),
+                        (f'Opus {rand.randint(1, 150)}',),
+                        (rand.choice(PERFORMERS),), ('',), ('',)]
+                props = [('times played', (str(rand.randint(0, 40)),)),
+                        ('date played', (random_date(rand),))]
+                track_ids = [(1, i + 1) for i in
+                        range(work_num * 3, work_num * 3 + 3)]
+                works[work_num] = WorkTuple(genre, metadata, [], props,
+                        track_ids, [])
+
+                short_metadata = tuple((v[0].split()[-1],)
+                        for v in metadata[:len(PRIMARY_KEYS)])
+                pickle.dump((short_metadata, uuid, work_num),
+                        short_files[genre])
+            props = [('source', ('CD',)), ('codec', ('flac',)),
+                    ('sample rate', ('44100',)), ('resolution', ('16',)),
+                    ('date created', (random_date(rand),))]
+            recording_shelf[uuid] = RecordingTuple(works, tracks, props,
+                    [f'disc{n}'], uuid)
+    for fo in short_files.values():
+        fo.close()
+
+    genre_spec = {genre: {'primary': list(PRIMARY_KEYS),
+            'secondary': list(SECONDARY_KEYS)} for genre in GENRES}
+    config = {'genre spec': genre_spec,
+            'column widths': {g: [120, 200, 120] for g in GENRES},
+            'filter config': {g: [] for g in GENRES},
+            'random config': {g: [0, False] for g in GENRES},
+            'sort indicators': {g: [True, False, False] for g in GENRES},
+            'user props': [],
+            'completers': {'composer': (True, True),
+                    'performer': (True, True)},
+            'geometry': {'window_width': 800, 'window_height': 480,
+                    'right_panel_width': 341,
+                    'selector_paned_position': 254,
+                    'import_paned_position': 160},
+            'trackmetadata keys': []}
+    with open(CONFIG, 'wb') as config_fo:
+        pickle.dump(config, config_fo)
+
+# Bytes under path that are not shared with another hard link.
+def disk_use(path):
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            stat = os.stat(Path(dirpath, filename))
+            if stat.st_nlink == 1:
+                total += stat.st_size
+    return total
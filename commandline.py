@@ -8,6 +8,10 @@ parser = argparse.ArgumentParser(
 
 parser.add_argument('-p', '--preserve', action='store_true',
         help='do not delete checkpoints when starting')
+parser.add_argument('-z', '--compress', action='store_true',
+        help='compress checkpoints with xz')
+parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+        help='run key operations on large genres in N processes')
 
 args = parser.parse_args()
 
@@ -0,0 +1,26 @@
+"""Abbreviate long names (values of primary keys) for short metadata."""
+
+import functools
+import re
+
+NULLVALUE = ('',)
+
+# Drop forenames: keep the last word of a name, but keep a suffix such as
+# II or Jr. with the word before it.
+OMIT_FORENAMES = (r'(?u)[\w\s&,-]+\s+(?!I{2,3}$|[JS]r\.*$)', '')
+PATTERN = re.compile(OMIT_FORENAMES[0])
+
+# The same composers and performers turn up in thousands of works.
+CACHE_SIZE = 8192
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def abbrev(name):
+    if name == NULLVALUE:
+        return name
+    return PATTERN.sub(OMIT_FORENAMES[1], name)
+
+# Abbreviate every name in names, working out each distinct name once.
+def abbrev_many(names):
+    names = list(names)
+    short_names = {name: abbrev(name) for name in set(names)}
+    return [short_names[name] for name in names]
@@ -1,55 +1,295 @@
+import lzma
+import os
+import pickle
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from common.constants import COMPLETERS
+from common.constants import CONFIG
 from common.constants import DATABASE
+from common.constants import LONG
 from common.constants import METADATA
+from common.constants import REWRITE_LOG
+from common.constants import SHORT
+from common.constants import SHORT_INDEX
+from common.longstore import open_long
+from common.journal import JournaledShelf, apply_journal, open_marker
 
 CHECKPOINTS = Path(DATABASE, '.checkpoints')
+MANIFEST = Path(CHECKPOINTS, '.manifest')
+JOURNAL = '.journal'
 
-def push_checkpoint(comment):
-    n_checkpoints = len(list(CHECKPOINTS.iterdir()))
-    new_checkpoint = Path(CHECKPOINTS, str(n_checkpoints + 1))
-    shutil.copytree(METADATA, new_checkpoint)
+# Oldest checkpoints are evicted once the stack exceeds either limit. The
+# top checkpoint is never evicted.
+MAX_DEPTH = 100
+MAX_BYTES = 2**30
 
-    # Write comment into new checkpoint.
-    Path(new_checkpoint, '.comment').write_text(comment)
+# Suffixes that the various dbm implementations add to LONG.
+DBM_SUFFIXES = ('', '.db', '.dat', '.dir', '.bak', '.pag')
+
+# Files (or directories of files) that are rewritten in place rather than
+# replaced by renaming a new file over them. A hard link would share their
+# inode with METADATA, so they always get a real copy. Completer files are
+# edited in place by an external editor. Callers name any others in
+# push_checkpoint.
+ALWAYS_COPY = (CONFIG, COMPLETERS)
+
+# Files that exist only while something is being written: the journal and
+# rewrite log, the temporary files of atomic writes, and short files
+# waiting to replace the old ones (see operations.adjust). A checkpoint must
+# not freeze them, or undo would bring them back. Suffixes are only
+# matched in the directories where they are made, so that a completer or
+# genre named like one is kept.
+TRANSIENT_NAMES = (JOURNAL, open_marker(JOURNAL).name, REWRITE_LOG.name)
+TRANSIENT_SUFFIXES = {METADATA: ('.tmp',), SHORT: ('.tmp', '.new'),
+        SHORT_INDEX: ('.tmp',)}
+
+# Store copied files and journals compressed with xz. Linked files cost
+# nothing, so they stay as they are.
+# A low preset keeps the copies made on the main thread quick; pickles
+# compress well even so.
+compress = False
+COMPRESS_PRESET = 1
+COMPRESSED_SUFFIX = '.xz'
+
+# One worker, so checkpoints are finished in the order they were pushed.
+executor = ThreadPoolExecutor(max_workers=1)
+pending = None
+manifest_lock = threading.Lock()
+
+# Checkpoints are taken in two steps. The files in touched are copied
+# right away because the caller is about to rewrite them in place. The rest
+# of METADATA is linked on a worker thread so that the main loop does not
+# block. Anything that renames, creates or deletes a file in METADATA must
+# call wait first. Return the Future for the worker.
+def push_checkpoint(comment, touched=()):
+    touched = ALWAYS_COPY + tuple(touched)
+    with manifest_lock:
+        manifest = read_manifest()
+        name = str(manifest['next'])
+        manifest['next'] += 1
+
+        # The previous checkpoint's journal is complete now, so charge it.
+        if stack := manifest['stack']:
+            journal_path = Path(CHECKPOINTS, stack[-1]['name'], JOURNAL)
+            if journal_path.exists():
+                stack[-1]['size'] += journal_path.stat().st_size
+
+        new_checkpoint = Path(CHECKPOINTS, name)
+        size = copy_touched(new_checkpoint, touched)
+        stack.append({'name': name, 'comment': comment, 'size': size,
+                'time': time.time(), 'compressed': compress})
+        write_manifest(manifest)
+
+    global pending
+    pending = executor.submit(finish_checkpoint, new_checkpoint, touched)
+    return pending
+
+def wait():
+    if pending is not None:
+        pending.result()
+
+def copy_touched(checkpoint, touched):
+    size = 0
+    checkpoint.mkdir()
+    for path in map(Path, touched):
+        dest = Path(checkpoint, path.relative_to(METADATA))
+        if path.is_dir():
+            dest.mkdir()
+            for src in path.iterdir():
+                size += copy_file(src, Path(dest, src.name))
+            continue
+        # dbm implementations may add a suffix (long.db, long.dat).
+        for suffix in DBM_SUFFIXES:
+            src = Path(str(path) + suffix)
+            if src.is_file():
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                size += copy_file(src, Path(dest.parent, src.name))
+    return size
+
+# Return the number of bytes that the copy occupies.
+def copy_file(src, dest):
+    if not compress:
+        shutil.copy2(src, dest)
+        return dest.stat().st_size
+    dest = Path(str(dest) + COMPRESSED_SUFFIX)
+    with open(src, 'rb') as fo_src, lzma.open(dest, 'wb',
+            preset=COMPRESS_PRESET) as fo_dest:
+        shutil.copyfileobj(fo_src, fo_dest)
+    return dest.stat().st_size
+
+def decompress_files(checkpoint):
+    for path in list(checkpoint.rglob('*' + COMPRESSED_SUFFIX)):
+        dest = path.with_suffix('')
+        with lzma.open(path, 'rb') as fo_src, open(dest, 'wb') as fo_dest:
+            shutil.copyfileobj(fo_src, fo_dest)
+        path.unlink()
+
+def finish_checkpoint(checkpoint, touched):
+    size = snapshot(checkpoint, touched)
+    with manifest_lock:
+        manifest = read_manifest()
+        for entry in manifest['stack']:
+            if entry['name'] == checkpoint.name:
+                entry['size'] += size
+        evict(manifest['stack'])
+        write_manifest(manifest)
+
+def transient(path):
+    return path.name in TRANSIENT_NAMES \
+            or path.suffix in TRANSIENT_SUFFIXES.get(path.parent, ())
+
+# Hard link every file in METADATA into checkpoint except the ones in
+# touched, which copy_touched already copied. Anything that replaces a file
+# by rename (the *_in_long rewrites, the short .tmp files) leaves the linked
+# inode intact, so the checkpoint costs a directory entry per file instead
+# of a copy of the whole library. Return the number of bytes copied.
+def snapshot(checkpoint, touched):
+    touched = {Path(p) for p in touched}
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(METADATA):
+        dest_dir = Path(checkpoint, Path(dirpath).relative_to(METADATA))
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        for filename in filenames:
+            src = Path(dirpath, filename)
+            if touched.intersection((src, src.with_suffix(''), src.parent)) \
+                    or transient(src):
+                continue
+            dest = Path(dest_dir, filename)
+            try:
+                os.link(src, dest)
+            except OSError:
+                # No hard links on this filesystem.
+                size += copy_file(src, dest)
+    return size
+
+def evict(stack):
+    total = sum(entry['size'] for entry in stack)
+    while len(stack) > 1 and (len(stack) > MAX_DEPTH or total > MAX_BYTES):
+        entry = stack.pop(0)
+        total -= entry['size']
+        shutil.rmtree(Path(CHECKPOINTS, entry['name']), ignore_errors=True)
 
 def pop_checkpoint():
-    try:
-        n_checkpoints = len(list(CHECKPOINTS.iterdir()))
-    except ValueError:
-        # .checkpoints directory is empty (should never happen because the
-        # undo button should have been disabled).
+    wait()
+    manifest = read_manifest()
+    if not manifest['stack']:
+        # Should never happen because the undo button should have been
+        # disabled.
         return
+    entry = manifest['stack'].pop()
 
-    # Replace METADATA with the last checkpoint.
+    # Replace METADATA with the last checkpoint. If the operation journaled
+    # its writes to LONG, keep the current LONG instead and roll back just
+    # the records in the journal.
+    last_checkpoint = Path(CHECKPOINTS, entry['name'])
+    journal_path = Path(last_checkpoint, JOURNAL)
+    if journal_path.exists():
+        for suffix in DBM_SUFFIXES:
+            Path(last_checkpoint, LONG.name + suffix).unlink(missing_ok=True)
+            long_path = Path(str(LONG) + suffix)
+            if long_path.exists():
+                long_path.rename(Path(last_checkpoint, long_path.name))
+    if entry.get('compressed'):
+        decompress_files(last_checkpoint)
     shutil.rmtree(METADATA)
-    Path(CHECKPOINTS, str(n_checkpoints)).rename(METADATA)
+    last_checkpoint.rename(METADATA)
+
+    journal_path = Path(METADATA, JOURNAL)
+    if journal_path.exists():
+        with open_long('w') as recording_shelf:
+            apply_journal(journal_path, recording_shelf)
+        journal_path.unlink()
+        open_marker(journal_path).unlink(missing_ok=True)
+
+    # Checkpoints made before the manifest existed carry their comment.
+    Path(METADATA, '.comment').unlink(missing_ok=True)
 
-    # We do not need the comment anymore for what used to be the last
-    # checkpoint.
-    Path(METADATA, '.comment').unlink()
+    write_manifest(manifest)
+    return top_comment(manifest)
 
-    # Update the comment.
-    comment = update_comment()
-    return comment
+# Open LONG for in-place writes, saving the before-image of each record in
+# the last checkpoint so that undo does not need a copy of LONG.
+def journaled(mode='c'):
+    wait()
+    recording_shelf = open_long(mode)
+    if not (stack := read_manifest()['stack']):
+        return recording_shelf
+    journal_path = Path(CHECKPOINTS, stack[-1]['name'], JOURNAL)
+    return JournaledShelf(recording_shelf, journal_path, compress,
+            COMPRESS_PRESET)
+
+# If waxconfig died in the middle of a journaled write, undo the whole
+# operation so that LONG agrees with config and the short files again.
+# Return True if there was something to undo.
+def recover():
+    CHECKPOINTS.mkdir(exist_ok=True)
+    if not (stack := read_manifest()['stack']):
+        return False
+    journal_path = Path(CHECKPOINTS, stack[-1]['name'], JOURNAL)
+    if not open_marker(journal_path).exists():
+        return False
+    pop_checkpoint()
+    return True
+
+# Roll back the writes to LONG since the last checkpoint, except those to
+# the records in keep. A resumed rewrite (see common.rewritelog) keeps the
+# records it finished and redoes the rest.
+def roll_back(keep):
+    wait()
+    if not (stack := read_manifest()['stack']):
+        return
+    journal_path = Path(CHECKPOINTS, stack[-1]['name'], JOURNAL)
+    if journal_path.exists():
+        with open_long('w') as recording_shelf:
+            apply_journal(journal_path, recording_shelf, keep)
+    open_marker(journal_path).unlink(missing_ok=True)
 
 def remove_checkpoints():
+    wait()
     if CHECKPOINTS.is_dir():
         shutil.rmtree(CHECKPOINTS)
     CHECKPOINTS.mkdir()
 
 def update_comment():
-    if CHECKPOINTS.is_dir():
-        if n_checkpoints := len(list(CHECKPOINTS.iterdir())):
-            last_checkpoint = Path(CHECKPOINTS, str(n_checkpoints))
-            comment = Path(last_checkpoint, '.comment').read_text()
-        else:
-            comment = ''
-    else:
-        CHECKPOINTS.mkdir()
-        comment = ''
-    return comment
+    CHECKPOINTS.mkdir(exist_ok=True)
+    return top_comment(read_manifest())
+
+def top_comment(manifest):
+    if stack := manifest['stack']:
+        return stack[-1]['comment']
+    return ''
+
+# -Manifest--------------------------------------------------------------------
+# The manifest records the checkpoint stack (bottom first) so that the depth
+# and the undo label come from one read instead of a directory scan.
+def read_manifest():
+    try:
+        with open(MANIFEST, 'rb') as manifest_fo:
+            return pickle.load(manifest_fo)
+    except FileNotFoundError:
+        return legacy_manifest()
+
+def write_manifest(manifest):
+    tmp_path = MANIFEST.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as manifest_fo:
+        pickle.dump(manifest, manifest_fo)
+    os.replace(tmp_path, MANIFEST)
+
+# Build a manifest for checkpoints numbered 1..n with a .comment file each
+# (kept by --preserve from before the manifest existed).
+def legacy_manifest():
+    stack = []
+    n = 1
+    while (checkpoint := Path(CHECKPOINTS, str(n))).is_dir():
+        comment_path = Path(checkpoint, '.comment')
+        stack.append({'name': str(n), 'comment': comment_path.read_text(),
+                'size': 0, 'time': comment_path.stat().st_mtime})
+        n += 1
+    return {'next': n, 'stack': stack}
 
 def make_comment(*args):
     # args has alternating text and data.
@@ -65,4 +305,3 @@ def make_comment(*args):
         except StopIteration:
             break
     return ' '.join(markup)
-
@@ -0,0 +1,153 @@
+"""Read and write the config file (METADATA/config).
+
+Config is a dict of sections. wax loads the config file with pickle.load,
+so it is written as one pickle of the whole dict. A copy of it is kept in
+METADATA/config cache with each section pickled on its own, after a header
+giving the offset of an index at the end of the file. The index holds the
+stamp (size and mtime) of the config file the copy was made from, and
+lists (section, offset, length) in order. While the stamp matches, reading
+the config maps the copy into memory and unpickles just the index. A
+section is unpickled the first time it is used, so startup and undo only
+pay for the sections that are used. Anything else that writes the config
+file (wax) changes its stamp, and then the whole file is unpickled and the
+copy is made again.
+
+Writing the config file unpickles any section that was never used, since
+wax needs the whole dict, but the copy is written from the pickles of
+those sections as they were. The copy is only ever replaced by rename,
+never rewritten in place, so a map of it stays valid after it is replaced.
+"""
+
+import mmap
+import os
+import pickle
+import struct
+from collections.abc import MutableMapping
+from pathlib import Path
+
+from common.constants import CONFIG_CACHE
+
+MAGIC = b'WAXCONF1'
+HEADER = struct.Struct('<8sQ')    # magic, index offset
+
+class Sections(MutableMapping):
+    def __init__(self, buffer=b'', index=()):
+        self.buffer = buffer
+        # The value of each section, or its (offset, length) in buffer
+        # while it is still encoded.
+        self.sections = {section: (offset, length)
+                for section, offset, length in index}
+        self.encoded = set(self.sections)
+
+    def __getitem__(self, section):
+        value = self.sections[section]
+        if section in self.encoded:
+            value = pickle.loads(self.raw(section))
+            self.sections[section] = value
+            self.encoded.discard(section)
+        return value
+
+    def __setitem__(self, section, value):
+        self.sections[section] = value
+        self.encoded.discard(section)
+
+    def __delitem__(self, section):
+        del self.sections[section]
+        self.encoded.discard(section)
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def __len__(self):
+        return len(self.sections)
+
+    # Mapping would decode the section.
+    def __contains__(self, section):
+        return section in self.sections
+
+    # The pickle of section as it is in the copy, or None if the section
+    # has been used since.
+    def raw(self, section):
+        if section not in self.encoded:
+            return None
+        offset, length = self.sections[section]
+        return self.buffer[offset:offset+length]
+
+def raw(sections, section):
+    if isinstance(sections, Sections):
+        return sections.raw(section)
+    return None
+
+# Whether section is encoded the same way in both. Different encodings can
+# still hold equal values.
+def same_raw(sections, other_sections, section):
+    section_raw = raw(sections, section)
+    return section_raw is not None \
+            and section_raw == raw(other_sections, section)
+
+def stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+# Return the config in path as a Sections, from the copy if it is current.
+# Stamp before reading: if the file changes in between, the copy is stale
+# rather than wrong.
+def read(path):
+    path_stamp = stamp(path)
+    if (sections := read_cache(path_stamp)) is not None:
+        return sections
+    with open(path, 'rb') as config_fo:
+        sections = Sections()
+        sections.update(pickle.load(config_fo))
+    write_cache(sections, path_stamp, {})
+    return sections
+
+def read_cache(path_stamp):
+    try:
+        with open(CONFIG_CACHE, 'rb') as cache_fo:
+            header = cache_fo.read(HEADER.size)
+            if len(header) < HEADER.size or not header.startswith(MAGIC):
+                return None
+            buffer = mmap.mmap(cache_fo.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+        magic, index_offset = HEADER.unpack(header)
+        cache_stamp, index = pickle.loads(buffer[index_offset:])
+    except (FileNotFoundError, ValueError, EOFError, pickle.UnpicklingError):
+        return None
+    if cache_stamp != path_stamp:
+        return None
+    return Sections(buffer, index)
+
+# Write sections to path through a temporary file, so that a crash leaves
+# either the old config or the new one. Then make the copy. Sections that
+# were never used are decoded for the write but left encoded in sections,
+# so that diffing it against the config after undo can still skip them.
+def write(path, sections):
+    raws = {section: raw(sections, section) for section in sections}
+    tmp_path = Path(path).with_suffix('.tmp')
+    with open(tmp_path, 'wb') as config_fo:
+        pickle.dump({section: sections[section] if section_raw is None
+                else pickle.loads(section_raw)
+                for section, section_raw in raws.items()}, config_fo)
+    os.replace(tmp_path, path)
+    write_cache(sections, stamp(path), raws)
+
+# raws holds the pickles of the sections that are still encoded.
+def write_cache(sections, path_stamp, raws):
+    tmp_path = CONFIG_CACHE.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as cache_fo:
+        cache_fo.write(HEADER.pack(MAGIC, 0))
+        index = []
+        for section in sections:
+            if (section_raw := raws.get(section)) is None:
+                section_raw = pickle.dumps(sections[section])
+            index.append((section, cache_fo.tell(), len(section_raw)))
+            cache_fo.write(section_raw)
+        index_offset = cache_fo.tell()
+        pickle.dump((path_stamp, index), cache_fo)
+        cache_fo.seek(0)
+        cache_fo.write(HEADER.pack(MAGIC, index_offset))
+    os.replace(tmp_path, CONFIG_CACHE)
@@ -3,9 +3,16 @@ from pathlib import Path
 DATABASE = 'recordings'
 METADATA = Path(DATABASE, 'metadata')
 CONFIG = Path(METADATA, 'config')
+CONFIG_CACHE = Path(METADATA, 'config cache')
 COMPLETERS = Path(METADATA, 'completers')
 SHORT = Path(METADATA, 'short')
+SHORT_INDEX = Path(METADATA, 'short index')
 LONG = Path(METADATA, 'long')
+GENRE_INDEX = Path(METADATA, 'genre index')
+WORK_COUNTS = Path(METADATA, 'work counts')
+STATS = Path(METADATA, 'stats')
+PENDING_EDITS = Path(METADATA, 'pending edits')
+REWRITE_LOG = Path(METADATA, '.rewrite')
 
 DOCUMENTS = Path(DATABASE, 'documents')
 IMAGES = Path(DATABASE, 'images')
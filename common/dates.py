@@ -0,0 +1,28 @@
+"""Parse the dates in props, which read like '2024 Mar 05'.
+
+A date is parsed into its ordinal (datetime.toordinal), so that dates sort
+and compare as integers. An empty date is 0, before any other. A library
+holds far fewer distinct dates than works, so parsing is memoized.
+
+Props stay (str, ...) tuples, because wax reads them. The ordinals are
+kept beside them instead: common.stats keeps the ordinal of each work it
+ranks in the sort key of its entry, next to the date as shown.
+"""
+
+import functools
+from datetime import datetime
+
+FORMAT = '%Y %b %d'
+
+CACHE_SIZE = 8192
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse(date):
+    return datetime.strptime(date, FORMAT).toordinal() if date else 0
+
+def display(ordinal):
+    return datetime.fromordinal(ordinal).strftime(FORMAT) if ordinal else ''
+
+# The ordinal of a date prop value, (date,).
+def ordinal(value):
+    return parse(value[0])
@@ -0,0 +1,63 @@
+"""Maintain an index from genre to the uuids of recordings with that genre."""
+
+import contextlib
+import os
+import pickle
+
+from common.constants import GENRE_INDEX, LONG
+from common.longstore import backend, open_long
+
+# The index is stamped with the size and mtime of LONG when it was last
+# known to match. Anything else that writes LONG (wax, undo) changes the
+# stamp, and then the index gets rebuilt on next use. The SQLite backend
+# keeps its own index of works by genre, so there the file is not used.
+def stamp():
+    stat = os.stat(LONG)
+    return (stat.st_size, stat.st_mtime_ns)
+
+def read():
+    if backend() == 'sqlite':
+        with open_long('r') as store:
+            return store.genre_index()
+    try:
+        with open(GENRE_INDEX, 'rb') as index_fo:
+            index_stamp, index = pickle.load(index_fo)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+    if index_stamp != stamp():
+        return None
+    return index
+
+def write(index):
+    if backend() == 'sqlite':
+        return
+    tmp_path = GENRE_INDEX.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as index_fo:
+        pickle.dump((stamp(), index), index_fo)
+    os.replace(tmp_path, GENRE_INDEX)
+
+def rebuild():
+    index = {}
+    if os.path.getsize(LONG):
+        with open_long('r') as store:
+            index = store.genre_index()
+    write(index)
+    return index
+
+def load():
+    if (index := read()) is None:
+        index = rebuild()
+    return index
+
+def uuids(genre):
+    return load().get(genre, set())
+
+# For writes to LONG that do not change which genres a recording holds
+# (the key operations). If the index was current before the write, it is
+# still current afterward, so just restamp it.
+@contextlib.contextmanager
+def unchanged():
+    index = read()
+    yield
+    if index is not None:
+        write(index)
@@ -0,0 +1,111 @@
+"""Record before-images of long records so that undo restores only those."""
+
+import lzma
+import pickle
+from pathlib import Path
+
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+# A journal is a stream of pickled (key, raw) pairs where raw is the pickled
+# RecordingTuple as it was before the first write to key during the
+# operation, or None if key did not exist.
+class JournaledShelf:
+    def __init__(self, shelf, journal_path, compress=False,
+            compress_preset=1):
+        self.shelf = shelf
+        self.journal_path = journal_path
+        self.compress = compress
+        self.compress_preset = compress_preset
+        self.recorded = set()
+        self.fo_journal = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, attr):
+        return getattr(self.shelf, attr)
+
+    def __iter__(self):
+        return iter(self.shelf)
+
+    def __len__(self):
+        return len(self.shelf)
+
+    def __contains__(self, key):
+        return key in self.shelf
+
+    def __getitem__(self, key):
+        return self.shelf[key]
+
+    def __setitem__(self, key, val):
+        self.record(key)
+        self.shelf[key] = val
+
+    def __delitem__(self, key):
+        self.record(key)
+        del self.shelf[key]
+
+    def set_raw(self, key, raw):
+        self.record(key)
+        self.shelf.set_raw(key, raw)
+
+    def del_raw(self, key):
+        self.record(key)
+        self.shelf.del_raw(key)
+
+    def record(self, key):
+        if key in self.recorded:
+            return
+        self.recorded.add(key)
+
+        # Save the raw bytes so that the before-image is not re-pickled.
+        raw = self.shelf.get_raw(key)
+        if self.fo_journal is None:
+            open_marker(self.journal_path).touch()
+            self.fo_journal = open(self.journal_path, 'ab')
+        entry = pickle.dumps((key, raw))
+        if self.compress:
+            # One xz stream per entry so that each one is complete on disk.
+            # lzma.open reads concatenated streams as one.
+            entry = lzma.compress(entry, preset=self.compress_preset)
+        self.fo_journal.write(entry)
+
+        # The before-image has to be on disk before the record changes.
+        self.fo_journal.flush()
+
+    def close(self):
+        self.shelf.close()
+        if self.fo_journal is not None:
+            self.fo_journal.close()
+            open_marker(self.journal_path).unlink()
+
+# The marker exists while writes are in progress. If it is still there at
+# startup, the operation did not finish and LONG is only partly rewritten.
+def open_marker(journal_path):
+    journal_path = Path(journal_path)
+    return journal_path.with_name(journal_path.name + '.open')
+
+def read_journal(journal_path):
+    with open(journal_path, 'rb') as fo_journal:
+        is_xz = fo_journal.read(len(XZ_MAGIC)) == XZ_MAGIC
+    opener = lzma.open if is_xz else open
+    with opener(journal_path, 'rb') as fo_journal:
+        while True:
+            try:
+                yield pickle.load(fo_journal)
+            except EOFError:
+                break
+
+# Write the before-images in journal_path back into store (see
+# common.longstore), except those of keys in keep.
+def apply_journal(journal_path, store, keep=()):
+    for key, raw in read_journal(journal_path):
+        if key in keep:
+            continue
+        if raw is None:
+            store.del_raw(key)
+        else:
+            store.set_raw(key, raw)
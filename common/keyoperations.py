@@ -0,0 +1,260 @@
+"""The key operations that GenresBox applies to a genre.
+
+operations maps the name of each operation to its Operation. The steps
+run in the processes that operations.adjust_parallel spawns as well as in
+waxconfig, so this module must not import GTK or anything that does
+(common.utilities), and the steps must be picklable by reference.
+"""
+
+import pickle
+from collections import namedtuple
+from itertools import islice
+from typing import NamedTuple
+
+from common.abbreviations import abbrev, abbrev_many
+from common.longstore import PROTOCOL
+
+#DEFAULT_VALUE = lambda new_key: f'*{new_key}*'
+DEFAULT_VALUE = lambda new_key: ''
+NULLVALUE = ('',)
+
+class Value(namedtuple('Value', ['long', 'short'])):
+    __slots__ = ()
+
+    def __add__(self, other):
+        if other.long == NULLVALUE:
+            return self
+        elif self.long == NULLVALUE:
+            return other
+        else:
+            return Value(self.long + other.long, self.short + other.short)
+
+operations = {}
+
+# An operation has two steps. long_step updates the long metadata of one
+# work in recording_tuple and returns whatever short_step needs to know
+# about that work. short_step gets the columns of the whole short file
+# (see shortfile.read_columns) and the values from long_step in the same
+# order as the rows, and returns the new columns, or None if the short
+# file does not change. An operation with no short_step never changes it.
+class Operation(NamedTuple):
+    long_step: object
+    short_step: object = None
+
+def operation(f):
+    operation_name = f.__name__
+    operations[operation_name] = Operation(f)
+    return f
+
+def short_step(long_step):
+    def register(f):
+        name = long_step.__name__
+        operations[name] = operations[name]._replace(short_step=f)
+        return f
+    return register
+
+# Apply long_step to the works work_nums of recording_tuple and return
+# its values.
+def adjust_recording(long_step, local_vars, recording_tuple, work_nums):
+    return [long_step(recording_tuple, work_num, local_vars)
+            for work_num in work_nums]
+
+# Run adjust_recording on each (uuid, raw, work_nums) of shard in a worker.
+def adjust_shard(long_step, local_vars, shard):
+    results = []
+    for uuid, raw, work_nums in shard:
+        recording_tuple = pickle.loads(raw)
+        recording_values = adjust_recording(long_step, local_vars,
+                recording_tuple, work_nums)
+        results.append((uuid, pickle.dumps(recording_tuple, PROTOCOL),
+                recording_values))
+    return results
+
+@operation
+def add_key(recording_tuple, work_num, local_vars):
+    new_key = local_vars['new_key']
+    is_primary = local_vars['is_primary']
+
+    work = recording_tuple.works[work_num]
+
+    # If new_key is in nonce, use its value. Otherwise, assign
+    # a default value. If I use a value from nonce, I need to
+    # remove it from nonce.
+    nonce_dict = dict(recording_tuple.nonce)
+    if new_key in nonce_dict:
+        new_val = nonce_dict[new_key]
+        del nonce_dict[new_key]
+        work = work._replace(nonce=list(nonce_dict.items()))
+    elif is_primary:
+        new_val = (DEFAULT_VALUE(new_key),)
+    else:
+        new_val = NULLVALUE
+    work.metadata.append(new_val)
+    return new_val
+
+@short_step(add_key)
+def add_key_column(columns, new_vals, local_vars):
+    if local_vars['is_primary']:
+        short_names = abbrev_many(new_val[0] for new_val in new_vals)
+        return columns + [[(short_name,) for short_name in short_names]]
+
+@operation
+def delete_key(recording_tuple, work_num, local_vars):
+    del_key = local_vars['del_key']
+    all_keys = local_vars['all_keys']
+
+    work = recording_tuple.works[work_num]
+
+    # Remove the value corresponding to del_key from metadata
+    # and move it to nonce.
+    long_metadata = work.metadata
+    value_dict = dict(zip(all_keys, long_metadata))
+    if del_val := value_dict.pop(del_key):
+        recording_tuple.nonce.append(del_val)
+        work = work._replace(metadata=list(value_dict.values()))
+
+@short_step(delete_key)
+def delete_key_column(columns, values, local_vars):
+    del_key = local_vars['del_key']
+    all_keys = local_vars['all_keys']
+
+    if local_vars['is_primary']:
+        return [column for key, column in zip(all_keys, columns)
+                if key != del_key]
+
+# The value for new_key, given the value val of old_key and the value
+# nonce_long of a nonce new_key (or NULLVALUE).
+def renamed_value(val, nonce_long, old_key, new_key):
+    if val.long == (DEFAULT_VALUE(old_key),):
+        # old_key was newly created, so it was assigned
+        # a default value. If there happens to be a nonce
+        # with new_key, then its value is preferable to
+        # a default value. Otherwise, change the value
+        # to the default value for new_key.
+        new_long = nonce_long if nonce_long != NULLVALUE \
+                else (DEFAULT_VALUE(new_key),)
+        return Value(new_long, (abbrev(new_long[0]),))
+    else:
+        # old_key was not newly created, so it has a real
+        # value or NULLVALUE. If new_key also happens to
+        # be a nonce, preserve the nonce value by adding
+        # it to the value for old_key.
+        nonce_val = Value(nonce_long, (abbrev(nonce_long[0]),))
+        return val + nonce_val
+
+@operation
+def rename_key(recording_tuple, work_num, local_vars):
+    new_key = local_vars['new_key']
+    old_key = local_vars['old_key']
+    all_keys = local_vars['all_keys']
+
+    work = recording_tuple.works[work_num]
+    long_metadata = work.metadata
+
+    # If there is a nonce with the same key, remove the nonce
+    # from recording_tuple.nonce and attach its value to new_key.
+    nonce_dict = dict(work.nonce)
+    nonce_long = nonce_dict.get(new_key, NULLVALUE)
+    if nonce_long != NULLVALUE:
+        del nonce_dict[new_key]
+        work = work._replace(nonce=list(nonce_dict.items()))
+
+    # We already replaced old_key with new_key in the config. Now derive
+    # a value to assign to new_key; the other values stay as they are.
+    new_long_metadata = list(long_metadata)
+    old_long = NULLVALUE
+    if old_key in all_keys:
+        i = all_keys.index(old_key)
+        new_long_metadata += [NULLVALUE] * (i + 1 - len(new_long_metadata))
+        old_long = new_long_metadata[i]
+        new_long_metadata[i] = renamed_value(Value(old_long, NULLVALUE),
+                nonce_long, old_key, new_key).long
+
+    work = work._replace(metadata=new_long_metadata)
+    return old_long, nonce_long
+
+@short_step(rename_key)
+def rename_key_column(columns, values, local_vars):
+    new_key = local_vars['new_key']
+    old_key = local_vars['old_key']
+    all_keys = local_vars['all_keys']
+
+    if old_key not in all_keys[:len(columns)]:
+        return None
+    i = all_keys.index(old_key)
+    columns[i] = [renamed_value(Value(old_long, short), nonce_long,
+                old_key, new_key).short
+            for short, (old_long, nonce_long) in zip(columns[i], values)]
+    return columns
+
+@operation
+def rearrange_primary(recording_tuple, work_num, local_vars):
+    from_index = local_vars['from_index']
+    insert_index = local_vars['insert_index']
+
+    work = recording_tuple.works[work_num]
+    long_metadata = work.metadata
+
+    value = long_metadata.pop(from_index)
+    long_metadata.insert(insert_index, value)
+
+    work = work._replace(metadata=long_metadata)
+
+@short_step(rearrange_primary)
+def rearrange_primary_column(columns, values, local_vars):
+    column = columns.pop(local_vars['from_index'])
+    columns.insert(local_vars['insert_index'], column)
+    return columns
+
+@operation
+def rearrange_secondary(recording_tuple, work_num, local_vars):
+    from_index = local_vars['from_index'] + len(local_vars['primary_keys'])
+    insert_index = local_vars['insert_index'] \
+            + len(local_vars['primary_keys'])
+
+    work = recording_tuple.works[work_num]
+    long_metadata = work.metadata
+
+    value = long_metadata.pop(from_index)
+    long_metadata.insert(insert_index, value)
+
+    work._replace(metadata=long_metadata)
+
+@operation
+def demote_primary(recording_tuple, work_num, local_vars):
+    from_index = local_vars['from_index']
+    insert_index = local_vars['insert_index']
+
+    work = recording_tuple.works[work_num]
+    long_metadata = work.metadata
+
+    value = long_metadata.pop(from_index)
+    long_metadata.insert(insert_index, value)
+
+    work = work._replace(metadata=long_metadata)
+
+@short_step(demote_primary)
+def demote_primary_column(columns, values, local_vars):
+    del columns[local_vars['from_index']]
+    return columns
+
+@operation
+def promote_secondary(recording_tuple, work_num, local_vars):
+    from_index = local_vars['from_index']
+    insert_index = local_vars['insert_index']
+
+    work = recording_tuple.works[work_num]
+    long_metadata = work.metadata
+
+    value = long_metadata.pop(from_index)
+    long_metadata.insert(insert_index, value)
+
+    work = work._replace(metadata=long_metadata)
+    return value
+
+@short_step(promote_secondary)
+def promote_secondary_column(columns, values, local_vars):
+    short_names = iter(abbrev_many(v for value in values for v in value))
+    column = [tuple(islice(short_names, len(value))) for value in values]
+    columns.insert(local_vars['insert_index'], column)
+    return columns
@@ -0,0 +1,240 @@
+"""Open the long metadata store with whichever backend holds it.
+
+LONG is either a shelve (dbm) file or a SQLite database. The backend is
+recognized from the file itself, so callers just use open_long. Both
+backends are mappings from uuid to RecordingTuple and add the same few
+methods for raw (pickled) records and for scanning works.
+
+Convert between backends with
+
+    python -m common.longstore {shelve,sqlite}
+"""
+
+import json
+import os
+import pickle
+import shelve
+import sqlite3
+import sys
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import NamedTuple
+
+from common.constants import LONG
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+BACKENDS = ('shelve', 'sqlite')
+
+# Both backends store the same pickle, so raw records (and journals of
+# them) are interchangeable.
+PROTOCOL = pickle.DEFAULT_PROTOCOL
+
+class WorkRow(NamedTuple):
+    uuid: str
+    work_num: int
+    genre: str
+    metadata: object           # [(str, ...), ...]
+    props: dict                # {key: (str, ...)}
+    recording_props: dict      # {key: (str, ...)}
+
+def backend(path=LONG):
+    try:
+        with open(path, 'rb') as long_fo:
+            header = long_fo.read(len(SQLITE_MAGIC))
+    except FileNotFoundError:
+        return 'shelve'
+    return 'sqlite' if header == SQLITE_MAGIC else 'shelve'
+
+# flag has the meaning it has for shelve.open. A new store ('n') takes the
+# backend of LONG unless kind says otherwise.
+def open_long(flag='r', path=LONG, kind=None):
+    if kind is None:
+        kind = backend(LONG if flag == 'n' else path)
+    if kind == 'sqlite':
+        return SqliteStore(path, flag)
+    return ShelveStore(str(path), flag)
+
+class ShelveStore(shelve.DbfilenameShelf):
+    def __init__(self, filename, flag='c'):
+        super().__init__(filename, flag, protocol=PROTOCOL)
+
+    def get_raw(self, uuid):
+        try:
+            return self.dict[uuid.encode(self.keyencoding)]
+        except KeyError:
+            return None
+
+    def set_raw(self, uuid, raw):
+        self.dict[uuid.encode(self.keyencoding)] = raw
+
+    def del_raw(self, uuid):
+        try:
+            del self.dict[uuid.encode(self.keyencoding)]
+        except KeyError:
+            pass
+
+    def raw_items(self):
+        for key in self.dict.keys():
+            yield key.decode(self.keyencoding), self.dict[key]
+
+    def genre_index(self):
+        index = {}
+        for uuid, recording in self.items():
+            for work in recording.works.values():
+                index.setdefault(work.genre, set()).add(uuid)
+        return index
+
+    def iter_works(self):
+        for uuid, recording in self.items():
+            recording_props = dict(recording.props)
+            for work_num, work in recording.works.items():
+                yield WorkRow(uuid, work_num, work.genre, work.metadata,
+                        dict(work.props), recording_props)
+
+# One row per recording holds the pickled RecordingTuple, which is what
+# __getitem__ returns. The props of the recording and the genre, metadata
+# and props of each work are also stored as columns (JSON for the lists)
+# so that genre lookups and work scans are queries instead of unpickling.
+# Changes are committed when the store is closed, or rolled back if the
+# with block raises.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS recordings (
+    uuid TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    props TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS works (
+    uuid TEXT NOT NULL REFERENCES recordings (uuid) ON DELETE CASCADE,
+    work_num INTEGER NOT NULL,
+    genre TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    props TEXT NOT NULL,
+    PRIMARY KEY (uuid, work_num));
+CREATE INDEX IF NOT EXISTS works_genre ON works (genre);
+'''
+
+class SqliteStore(MutableMapping):
+    def __init__(self, path, flag='c'):
+        path = Path(path)
+        if flag[0] == 'n':
+            path.unlink(missing_ok=True)
+        elif flag[0] in 'rw' and not path.exists():
+            raise FileNotFoundError(path)
+        if flag[0] == 'r':
+            self.conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        else:
+            self.conn = sqlite3.connect(path)
+            self.conn.executescript(SCHEMA)
+        self.conn.execute('PRAGMA foreign_keys = ON')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None:
+            self.conn.rollback()
+        self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def sync(self):
+        self.conn.commit()
+
+    def __getitem__(self, uuid):
+        if (raw := self.get_raw(uuid)) is None:
+            raise KeyError(uuid)
+        return pickle.loads(raw)
+
+    def __setitem__(self, uuid, recording):
+        self.write(uuid, pickle.dumps(recording, PROTOCOL), recording)
+
+    def __delitem__(self, uuid):
+        cursor = self.conn.execute(
+                'DELETE FROM recordings WHERE uuid = ?', (uuid,))
+        if not cursor.rowcount:
+            raise KeyError(uuid)
+
+    def __iter__(self):
+        cursor = self.conn.execute('SELECT uuid FROM recordings')
+        return (uuid for uuid, in cursor)
+
+    def __len__(self):
+        count, = self.conn.execute(
+                'SELECT COUNT(*) FROM recordings').fetchone()
+        return count
+
+    def __contains__(self, uuid):
+        return self.get_raw(uuid) is not None
+
+    def items(self):
+        for uuid, raw in self.raw_items():
+            yield uuid, pickle.loads(raw)
+
+    def values(self):
+        for uuid, raw in self.raw_items():
+            yield pickle.loads(raw)
+
+    def write(self, uuid, raw, recording):
+        self.conn.execute(
+                'INSERT OR REPLACE INTO recordings VALUES (?, ?, ?)',
+                (uuid, raw, json.dumps(dict(recording.props))))
+        self.conn.execute('DELETE FROM works WHERE uuid = ?', (uuid,))
+        self.conn.executemany('INSERT INTO works VALUES (?, ?, ?, ?, ?)',
+                [(uuid, work_num, work.genre, json.dumps(work.metadata),
+                        json.dumps(dict(work.props)))
+                    for work_num, work in recording.works.items()])
+
+    def get_raw(self, uuid):
+        row = self.conn.execute('SELECT data FROM recordings WHERE uuid = ?',
+                (uuid,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_raw(self, uuid, raw):
+        self.write(uuid, raw, pickle.loads(raw))
+
+    def del_raw(self, uuid):
+        self.conn.execute('DELETE FROM recordings WHERE uuid = ?', (uuid,))
+
+    def raw_items(self):
+        yield from self.conn.execute('SELECT uuid, data FROM recordings')
+
+    def genre_index(self):
+        index = {}
+        for genre, uuid in self.conn.execute('SELECT genre, uuid FROM works'):
+            index.setdefault(genre, set()).add(uuid)
+        return index
+
+    def iter_works(self):
+        cursor = self.conn.execute('''
+                SELECT w.uuid, w.work_num, w.genre, w.metadata, w.props,
+                    r.props
+                FROM works AS w JOIN recordings AS r USING (uuid)
+                ORDER BY r.rowid, w.work_num''')
+        for uuid, work_num, genre, metadata, props, recording_props \
+                in cursor:
+            yield WorkRow(uuid, work_num, genre,
+                    [tuple(value) for value in json.loads(metadata)],
+                    json.loads(props, object_hook=tuple_values),
+                    json.loads(recording_props, object_hook=tuple_values))
+
+# JSON has no tuples, so the values of props come back as lists.
+def tuple_values(props):
+    return {key: tuple(value) for key, value in props.items()}
+
+# Copy LONG into a new store of backend kind and replace LONG with it.
+def convert(kind):
+    if kind == backend():
+        return
+    tmp_path = Path(str(LONG) + '.tmp')
+    with open_long('r') as src, open_long('n', tmp_path, kind) as dest:
+        for uuid, raw in src.raw_items():
+            dest.set_raw(uuid, raw)
+    os.replace(tmp_path, LONG)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] not in BACKENDS:
+        sys.exit('usage: python -m common.longstore {shelve,sqlite}')
+    convert(sys.argv[1])
@@ -0,0 +1,75 @@
+"""Report progress through long scans of LONG, and let them be cancelled.
+
+The scans wrap what they iterate over in track(). That costs nothing
+unless someone is watching: the GUI runs an operation inside
+monitoring(report), and then report gets a Report every INTERVAL seconds.
+Cancelling the monitor makes track raise Cancelled before the next item,
+so the scans track whole batches where stopping part way through one
+would leave it half done. Once the operation calls commit(), nothing is
+left to cancel and a cancel is ignored.
+"""
+
+import contextlib
+import time
+from typing import NamedTuple
+
+INTERVAL = 0.1
+
+class Cancelled(Exception):
+    pass
+
+class Report(NamedTuple):
+    done: int
+    total: object        # int, or None if not known
+    rate: float          # items a second
+    eta: object          # seconds left, or None if not known
+
+class Monitor:
+    def __init__(self, report):
+        self.report = report
+        self.cancelled = False
+        self.committed = False
+
+    def cancel(self):
+        self.cancelled = True
+
+# The monitor of the operation in progress, if any.
+monitor = None
+
+@contextlib.contextmanager
+def monitoring(report):
+    global monitor
+    monitor = Monitor(report)
+    try:
+        yield monitor
+    finally:
+        monitor = None
+
+# The operation being monitored has committed, and what is left of it
+# only finishes what is already done.
+def commit():
+    if monitor is not None:
+        monitor.committed = True
+
+# Yield the items of iterable. total is the number of items, or None.
+# If size is given, an item counts as size(item) items.
+def track(iterable, total=None, size=None):
+    if (watcher := monitor) is None:
+        yield from iterable
+        return
+
+    start = last = time.monotonic()
+    done = 0
+    watcher.report(Report(done, total, 0.0, None))
+    for item in iterable:
+        if watcher.cancelled and not watcher.committed:
+            raise Cancelled
+        yield item
+        done += 1 if size is None else size(item)
+
+        if (now := time.monotonic()) - last >= INTERVAL:
+            last = now
+            rate = done / (now - start)
+            eta = (total - done) / rate if total is not None and rate \
+                    else None
+            watcher.report(Report(done, total, rate, eta))
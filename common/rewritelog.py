@@ -0,0 +1,87 @@
+"""Record the progress of a rewrite of LONG so that it can be resumed.
+
+The log starts with a header that says what the rewrite is. The rewrite
+then adds an entry for each record once the record is safely in LONG,
+and COMMIT once the rest of the result is complete in temporary files
+and only has to be renamed into place. The log is removed when the
+rewrite finishes or fails, so a log found at startup belongs to a
+rewrite that was killed, and notebook resumes it.
+"""
+
+import pickle
+from typing import NamedTuple
+
+import common.progress as progress
+from common.constants import REWRITE_LOG
+
+COMMIT = 'commit'
+
+# Entries are logged after the store is synced, which is costly for dbm
+# files, so records are synced and logged in batches of this many.
+SYNC_EVERY = 100
+
+def batches(items):
+    return [items[i:i + SYNC_EVERY] for i in range(0, len(items), SYNC_EVERY)]
+
+class Progress(NamedTuple):
+    header: object
+    entries: list
+    committed: bool
+
+# Start a new log with header, or with no header add to the existing log
+# of a rewrite that is being resumed.
+class RewriteLog:
+    def __init__(self, header=None):
+        if header is None:
+            self.fo_log = open(REWRITE_LOG, 'ab')
+        else:
+            self.fo_log = open(REWRITE_LOG, 'wb')
+            self.write([header])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, entries):
+        for entry in entries:
+            pickle.dump(entry, self.fo_log)
+        self.fo_log.flush()
+
+    def done(self, entries):
+        if entries:
+            self.write(entries)
+
+    # A rewrite that has committed is finished even if it is cancelled.
+    def commit(self):
+        self.write([COMMIT])
+        progress.commit()
+
+    def close(self):
+        if not self.fo_log.closed:
+            self.fo_log.close()
+            REWRITE_LOG.unlink(missing_ok=True)
+
+def read():
+    try:
+        fo_log = open(REWRITE_LOG, 'rb')
+    except FileNotFoundError:
+        return None
+    entries = []
+    with fo_log:
+        while True:
+            try:
+                entries.append(pickle.load(fo_log))
+            except (EOFError, pickle.UnpicklingError):
+                # The last entry is cut short if the process died while
+                # writing it.
+                break
+    if not entries:
+        REWRITE_LOG.unlink()
+        return None
+    header, *entries = entries
+    committed = entries[-1:] == [COMMIT]
+    if committed:
+        entries.pop()
+    return Progress(header, entries, committed)
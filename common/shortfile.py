@@ -0,0 +1,185 @@
+"""Read and write short metadata files (short/<genre>).
+
+A short file holds one record per work, (short_metadata, uuid, work_num),
+as plain concatenated pickles. Short files are also read by wax, and wax
+adds a work by appending one, so the file itself is left in that format.
+Its index, [(uuid, work_num, offset), ...] for every record, is kept in
+short index/<genre> instead, so that counting needs no unpickling of
+records and any record can be read directly. Each index is stamped with
+the size and mtime of short/<genre> when it was made, as the work counts
+are. Anything else that writes a short file (wax, undo) changes its
+stamp, and then the index is rebuilt the next time it is read.
+"""
+
+import os
+import pickle
+from itertools import repeat
+from pathlib import Path
+from typing import NamedTuple
+
+from common.constants import SHORT_INDEX
+
+# A whole short file by column. columns[i][n] is the value of the i-th
+# primary key in the n-th record.
+class ShortColumns(NamedTuple):
+    columns: list        # [[(str, ...), ...], ...]
+    uuids: list          # [str, ...]
+    work_nums: list      # [int, ...]
+
+def read_records(path):
+    with open(path, 'rb') as fo_short:
+        while True:
+            try:
+                yield pickle.load(fo_short)
+            except EOFError:
+                break
+
+# -Index-----------------------------------------------------------------------
+
+def index_path(path):
+    return Path(SHORT_INDEX, Path(path).name)
+
+def stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+# Return the index of path, from short index/<genre> if it is current.
+# Stamp before scanning: if the file changes in between, the stored index
+# is stale rather than wrong.
+def read_index(path):
+    path_stamp = stamp(path)
+    if path_stamp is None:
+        return []
+    try:
+        with open(index_path(path), 'rb') as fo_index:
+            index_stamp, index = pickle.load(fo_index)
+        if index_stamp == path_stamp:
+            return index
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        pass
+    with open(path, 'rb') as fo_short:
+        index = scan(fo_short)
+    store_index(path, index, path_stamp)
+    return index
+
+def scan(fo_short):
+    index = []
+    while True:
+        offset = fo_short.tell()
+        try:
+            short_metadata, uuid, work_num = pickle.load(fo_short)
+        except EOFError:
+            break
+        index.append((uuid, work_num, offset))
+    return index
+
+# path was just written with index.
+def store_index(path, index, path_stamp=None):
+    if path_stamp is None:
+        path_stamp = stamp(path)
+    SHORT_INDEX.mkdir(exist_ok=True)
+    tmp_path = index_path(path).with_suffix('.tmp')
+    with open(tmp_path, 'wb') as fo_index:
+        pickle.dump((path_stamp, index), fo_index)
+    os.replace(tmp_path, index_path(path))
+
+# Renaming short/<genre> keeps its stamp.
+def rename_index(old_genre, new_genre):
+    try:
+        os.replace(Path(SHORT_INDEX, old_genre), Path(SHORT_INDEX, new_genre))
+    except FileNotFoundError:
+        pass
+
+def delete_index(genre):
+    Path(SHORT_INDEX, genre).unlink(missing_ok=True)
+
+def count(path):
+    return len(read_index(path))
+
+def fetch(path, uuid, work_num):
+    for entry_uuid, entry_work_num, offset in read_index(path):
+        if (entry_uuid, entry_work_num) == (uuid, work_num):
+            with open(path, 'rb') as fo_short:
+                fo_short.seek(offset)
+                return pickle.load(fo_short)
+    raise KeyError((uuid, work_num))
+
+# Yield records start..stop-1, so that several workers can each take a
+# slice of the same file.
+def read_range(path, start, stop, index=None):
+    if index is None:
+        index = read_index(path)
+    with open(path, 'rb') as fo_short:
+        for uuid, work_num, offset in index[start:stop]:
+            fo_short.seek(offset)
+            yield pickle.load(fo_short)
+
+# -Writing---------------------------------------------------------------------
+
+class ShortWriter:
+    def __init__(self, path):
+        self.fo_short = open(path, 'wb')
+        self.index = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def count(self):
+        return len(self.index)
+
+    def dump(self, record):
+        short_metadata, uuid, work_num = record
+        self.index.append((uuid, work_num, self.fo_short.tell()))
+        pickle.dump(record, self.fo_short)
+
+    def close(self):
+        self.fo_short.close()
+
+# Add one record to the end of path (how wax adds a work). The records
+# already there are copied as they are, without unpickling. The new file
+# replaces the old one by rename because checkpoints hard link short files.
+def append(path, record):
+    path = Path(path)
+    index = read_index(path)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as fo_tmp:
+        if path.exists():
+            with open(path, 'rb') as fo_short:
+                fo_tmp.write(fo_short.read())
+        short_metadata, uuid, work_num = record
+        index.append((uuid, work_num, fo_tmp.tell()))
+        pickle.dump(record, fo_tmp)
+    os.replace(tmp_path, path)
+    store_index(path, index)
+
+# Write records to path through a temporary file and return its index.
+# Storing the index is left to the caller, since path may itself be a
+# temporary file (see operations.adjust).
+def write_records(path, records):
+    tmp_path = Path(path).with_suffix('.tmp')
+    with ShortWriter(tmp_path) as writer:
+        for record in records:
+            writer.dump(record)
+    os.replace(tmp_path, path)
+    return writer.index
+
+def read_columns(path):
+    records = list(read_records(path))
+    if not records:
+        return ShortColumns([], [], [])
+    rows, uuids, work_nums = zip(*records)
+    return ShortColumns([list(column) for column in zip(*rows, strict=True)],
+            list(uuids), list(work_nums))
+
+def write_columns(path, short_columns):
+    columns, uuids, work_nums = short_columns
+    rows = zip(*columns, strict=True) if columns \
+            else repeat((), len(uuids))
+    return write_records(path, zip(rows, uuids, work_nums, strict=True))
@@ -0,0 +1,215 @@
+"""Keep the summary of LONG that the Info page shows in METADATA/stats.
+
+The summary holds the number of recordings and three rankings of works:
+by date played, by date created and by times played. It is stamped with
+the size and mtime of LONG, like the genre index. Anything that writes LONG
+without updating the summary (wax, undo) changes the stamp, and then the
+summary is rebuilt with one pass over LONG. The genre and property
+operations update it as they write LONG.
+
+Check or rebuild the summary with
+
+    python -m common.stats {verify,rebuild}
+"""
+
+import contextlib
+import heapq
+import os
+import pickle
+import sys
+from typing import NamedTuple
+
+import common.dates as dates
+import common.progress as progress
+from common.constants import LONG, STATS
+from common.genreindex import stamp
+from common.longstore import open_long
+
+N_ITEMS = 50
+
+# Each ranking keeps more works than it shows, so that deleting a genre
+# rarely leaves fewer than N_ITEMS works to show.
+DEPTH = 2 * N_ITEMS
+
+RANKINGS = ('date played', 'date created', 'times played')
+
+# Ties are broken by the keys of the earlier rankings, as when one list of
+# works was sorted by each ranking in turn, and then by uuid and work_num.
+# Not by position in LONG, since a rewrite of LONG can reorder it.
+class Entry(NamedTuple):
+    key: tuple
+    uuid: str
+    work_num: int
+    genre: str
+    metadata: object     # [(str, ...), ...]
+    value: str           # the date played, date created or times played
+
+class Summary(NamedTuple):
+    n_recordings: int
+    rankings: tuple      # ([Entry, ...], ...) best first, one per RANKINGS
+
+    # Whether works that are not in ranking i could rank above the last of
+    # its entries.
+    def complete(self, i):
+        return len(self.rankings[i]) < DEPTH
+
+    def top(self, i):
+        return self.rankings[i][:N_ITEMS]
+
+def read():
+    try:
+        with open(STATS, 'rb') as stats_fo:
+            summary_stamp, summary = pickle.load(stats_fo)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+    if summary_stamp != stamp():
+        return None
+    return summary
+
+def write(summary):
+    tmp_path = STATS.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as stats_fo:
+        pickle.dump((stamp(), summary), stats_fo)
+    os.replace(tmp_path, STATS)
+
+# One pass over the works keeps the DEPTH best of each ranking in a
+# min-heap.
+def scan():
+    heaps = ([], [], [])
+    if not os.path.getsize(LONG):
+        return Summary(0, heaps)
+    with open_long('r') as recording_store:
+        n_recordings = len(recording_store)
+        works = progress.track(recording_store.iter_works())
+        for work in works:
+            date_played = work.props['date played']
+            date_created = work.recording_props['date created']
+            times_played = work.props['times played'][0]
+            played = dates.ordinal(date_played)
+            created = dates.ordinal(date_created)
+            times = int(times_played) if times_played else 0
+            keys = ((played,), (created, played), (times, created, played))
+            values = (date_played[0], date_created[0], times_played)
+            for heap, key, value in zip(heaps, keys, values):
+                entry = Entry(key, work.uuid, work.work_num, work.genre,
+                        work.metadata, value)
+                if len(heap) < DEPTH:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+    return Summary(n_recordings,
+            tuple(sorted(heap, reverse=True) for heap in heaps))
+
+def rebuild():
+    summary = scan()
+    write(summary)
+    return summary
+
+def load():
+    if (summary := read()) is None:
+        summary = rebuild()
+    return summary
+
+# For a write to LONG. If the summary was current before the write, bring
+# it up to date with before(summary), which sees LONG as it was, and then
+# after(summary), which sees it as it is. Either returns None if it cannot
+# tell, and then the summary is rebuilt on next use.
+@contextlib.contextmanager
+def updated(before=None, after=None):
+    summary = read()
+    if summary is not None and before is not None:
+        summary = before(summary)
+    yield
+    if summary is not None and after is not None:
+        summary = after(summary)
+    if summary is not None:
+        write(summary)
+
+def rename_genre(old_genre, new_genre):
+    def update(summary):
+        return summary._replace(rankings=tuple(
+                [entry._replace(genre=new_genre)
+                        if entry.genre == old_genre else entry
+                    for entry in ranking]
+                for ranking in summary.rankings))
+    return update
+
+# Drop the works of genre. The works left in a recording are renumbered
+# as DeleteGenre does, so this needs LONG as it was.
+def delete_genre(genre):
+    def update(summary):
+        work_nums = {}
+        with open_long('r') as recording_store:
+            for ranking in summary.rankings:
+                for entry in ranking:
+                    if entry.genre != genre and entry.uuid not in work_nums:
+                        works = recording_store[entry.uuid].works
+                        kept = [work_num for work_num, work in works.items()
+                                if work.genre != genre]
+                        work_nums[entry.uuid] = {work_num: new_work_num
+                                for new_work_num, work_num in enumerate(kept)}
+        rankings = tuple(
+                [entry._replace(
+                        work_num=work_nums[entry.uuid][entry.work_num])
+                    for entry in ranking if entry.genre != genre]
+                for ranking in summary.rankings)
+        for i, ranking in enumerate(rankings):
+            if len(ranking) < N_ITEMS and not summary.complete(i):
+                return None
+        return summary._replace(rankings=rankings)
+    return update
+
+def count_recordings(summary):
+    with open_long('r') as recording_store:
+        return summary._replace(n_recordings=len(recording_store))
+
+# A key operation changes the metadata of the works in genre.
+def adjust_genre(genre):
+    def update(summary):
+        metadata = {}
+        with open_long('r') as recording_store:
+            for ranking in summary.rankings:
+                for entry in ranking:
+                    if entry.genre == genre and entry.uuid not in metadata:
+                        recording = recording_store[entry.uuid]
+                        metadata[entry.uuid] = {work_num: work.metadata
+                                for work_num, work in recording.works.items()}
+        return summary._replace(rankings=tuple(
+                [entry._replace(
+                        metadata=metadata[entry.uuid][entry.work_num])
+                        if entry.genre == genre else entry
+                    for entry in ranking]
+                for ranking in summary.rankings))
+    return update
+
+# Compare the stored summary with a fresh scan. Only what the Info page
+# shows counts.
+def verify():
+    try:
+        with open(STATS, 'rb') as stats_fo:
+            summary_stamp, summary = pickle.load(stats_fo)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return ['no summary']
+    problems = []
+    if summary_stamp != stamp():
+        problems.append('stale: LONG changed since the summary was written')
+    fresh = scan()
+    if summary.n_recordings != fresh.n_recordings:
+        problems.append(f'{summary.n_recordings} recordings, '
+                f'not {fresh.n_recordings}')
+    for i, name in enumerate(RANKINGS):
+        shown = [(entry.uuid, entry.work_num, entry.genre, entry.metadata,
+                    entry.value) for entry in summary.top(i)]
+        expected = [(entry.uuid, entry.work_num, entry.genre,
+                    entry.metadata, entry.value) for entry in fresh.top(i)]
+        if shown != expected:
+            problems.append(f'{name} ranking differs')
+    return problems
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] not in ('verify', 'rebuild'):
+        sys.exit('usage: python -m common.stats {verify,rebuild}')
+    if sys.argv[1] == 'rebuild':
+        rebuild()
+    elif problems := verify():
+        sys.exit('\n'.join(problems))
@@ -1,9 +1,9 @@
 import contextlib
+import copy
 import logging
 import os
-import pickle
 import sys
-from collections import namedtuple
+from collections import defaultdict, namedtuple
 from functools import wraps
 from inspect import currentframe, getframeinfo
 from pathlib import Path
@@ -13,17 +13,46 @@ import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk, GLib
 
+import common.configfile as configfile
 from common.constants import CONFIG
 
+# What Config.transaction saves for a section that did not exist.
+MISSING = object()
+
+# Changes are written behind: an assignment marks config dirty, and the
+# file is written once GTK is idle, so a batch of changes costs one write.
+# Call flush() where the file has to be current (before a checkpoint, a
+# rewrite of LONG, or exit). Inside transaction(), nothing is written until
+# the with block ends.
 class Config:
     def __init__(self):
-        with open(CONFIG, 'rb') as config_fo:
-            # Like self.config = pickle.load(config_fo).
-            self.__dict__['config'] = pickle.load(config_fo)
-
-    # After undo, Config needs to reread the pickle.
+        # What each open transaction saved: {section: value before it}.
+        self.__dict__['snapshots'] = []
+        self.__dict__['idle_id'] = None
+        self.__dict__['subscribers'] = defaultdict(list)
+        self.load()
+
+    def load(self):
+        # Like self.config = configfile.read(CONFIG).
+        self.__dict__['config'] = configfile.read(CONFIG)
+        self.__dict__['dirty'] = False
+
+    # After undo, Config needs to reread the file. Pending changes are
+    # dropped, because undo restored an older file. Subscribers are told
+    # what changed.
     def reread(self):
-        self.__init__()
+        if (idle_id := self.__dict__['idle_id']) is not None:
+            GLib.source_remove(idle_id)
+            self.__dict__['idle_id'] = None
+        old_config = self.__dict__['config']
+        self.load()
+        for change in diff_config(old_config, self.__dict__['config']):
+            for callback in self.__dict__['subscribers'][change.section]:
+                callback(change)
+
+    # Call callback(change) with each Change to section on reread.
+    def subscribe(self, section, callback):
+        self.__dict__['subscribers'][section].append(callback)
 
     # Support access either as attribute (config.attr_name)
     # or item (config['attr name']).
@@ -34,18 +63,78 @@ class Config:
 
     def __setattr__(self, attr, val):
         key = attr.replace('_', ' ')
+        self.snapshot(key)
         self.__dict__['config'][key] = val
-        with open(CONFIG, 'wb') as config_fo:
-            pickle.dump(self.__dict__['config'], config_fo)
+        self.write()
 
     def __getitem__(self, key):
         val = self.__dict__['config'].get(key, {})
         return val
 
     def __setitem__(self, key, val):
+        self.snapshot(key)
         self.__dict__['config'][key] = val
-        with open(CONFIG, 'wb') as config_fo:
-            pickle.dump(self.__dict__['config'], config_fo)
+        self.write()
+
+    def write(self):
+        if self.__dict__['snapshots']:
+            self.__dict__['dirty'] = True
+        elif self.__dict__['idle_id'] is None:
+            self.__dict__['idle_id'] = GLib.idle_add(self.on_idle)
+
+    def on_idle(self):
+        self.__dict__['idle_id'] = None
+        self.save()
+        return GLib.SOURCE_REMOVE
+
+    def flush(self):
+        if (idle_id := self.__dict__['idle_id']) is not None:
+            GLib.source_remove(idle_id)
+            self.__dict__['idle_id'] = None
+            self.save()
+
+    def save(self):
+        configfile.write(CONFIG, self.__dict__['config'])
+
+    # Make the changes in the with block as one: they are written with a
+    # single save when it ends, and if it raises, the sections it changed
+    # are put back as they were. A section is copied the first time it is
+    # assigned or modified in the transaction, so a section that is changed
+    # in place without modify is not put back. Transactions can nest; only
+    # the outermost one writes.
+    @contextlib.contextmanager
+    def transaction(self):
+        snapshots = self.__dict__['snapshots']
+        snapshots.append(snapshot := {})
+        try:
+            yield self
+        except BaseException:
+            sections = self.__dict__['config']
+            for section, value in snapshot.items():
+                if value is MISSING:
+                    sections.pop(section, None)
+                else:
+                    sections[section] = value
+            if len(snapshots) == 1:
+                self.__dict__['dirty'] = False
+            raise
+        finally:
+            snapshots.pop()
+        if not snapshots and self.__dict__['dirty']:
+            self.__dict__['dirty'] = False
+            if (idle_id := self.__dict__['idle_id']) is not None:
+                GLib.source_remove(idle_id)
+                self.__dict__['idle_id'] = None
+            self.save()
+
+    # Save section in each open transaction that has not saved it yet. Each
+    # gets its own copy, because putting one back makes it live again.
+    def snapshot(self, section):
+        sections = self.__dict__['config']
+        for snapshot in self.__dict__['snapshots']:
+            if section not in snapshot:
+                snapshot[section] = copy.deepcopy(sections[section]) \
+                        if section in sections else MISSING
 
     def __str__(self):
         return pformat(self.__dict__['config'])
@@ -55,10 +144,41 @@ class Config:
     @staticmethod
     @contextlib.contextmanager
     def modify(key):
+        config.snapshot(key)
         spec = config[key]
         yield spec
         config[key] = spec
 
+# A change to config found on reread. key is a key of the section (a genre,
+# a completer, a dimension), or None if the section changed as a whole. old
+# is None for a new key, and new is None for a deleted one.
+Change = namedtuple('Change', ['section', 'key', 'old', 'new'])
+
+# Dict sections are compared key by key, unless the keys that both old and
+# new have are in a different order (the genres were reordered).
+def diff_config(old_config, new_config):
+    changes = []
+    sections = list(old_config) \
+            + [section for section in new_config if section not in old_config]
+    for section in sections:
+        # Without decoding sections that are the same in both files.
+        if configfile.same_raw(old_config, new_config, section):
+            continue
+        old, new = old_config.get(section), new_config.get(section)
+        # Dicts compare equal whatever the order of their keys.
+        if old == new and (not isinstance(old, dict)
+                or list(old) == list(new)):
+            continue
+        if isinstance(old, dict) and isinstance(new, dict) \
+                and [key for key in old if key in new] \
+                    == [key for key in new if key in old]:
+            keys = list(old) + [key for key in new if key not in old]
+            changes += [Change(section, key, old.get(key), new.get(key))
+                    for key in keys if old.get(key) != new.get(key)]
+        else:
+            changes.append(Change(section, None, old, new))
+    return changes
+
 config = Config()
 
 def debug(arg, comment=''):
@@ -87,18 +207,6 @@ def tracer(f):
         #return f(*args, **kwargs)
     return new_f
 
-NULLVALUE = ('',)
-class Value(namedtuple('Value', ['long', 'short'])):
-    __slots__ = ()
-
-    def __add__(self, other):
-        if other.long == NULLVALUE:
-            return self
-        elif self.long == NULLVALUE:
-            return other
-        else:
-            return Value(self.long + other.long, self.short + other.short)
-
 # If text is already in model, append a number to make the resulting
 # string unique.
 def make_unique(text, existing_text):
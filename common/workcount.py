@@ -0,0 +1,83 @@
+"""Cache the number of works in each short file, for the Info page.
+
+Each count is stamped with the size and mtime of short/<genre> when it was
+counted, as the genre index is stamped with those of LONG. Anything else
+that writes a short file (wax, undo) changes its stamp, and then the count
+is stale until it is recounted. The genre and key operations keep the
+cache current as they go.
+"""
+
+import os
+import pickle
+from pathlib import Path
+
+import common.shortfile as shortfile
+from common.constants import SHORT, WORK_COUNTS
+
+def stamp(genre):
+    try:
+        stat = os.stat(Path(SHORT, genre))
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+# {genre: (stamp, count)}
+def read():
+    try:
+        with open(WORK_COUNTS, 'rb') as counts_fo:
+            return pickle.load(counts_fo)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return {}
+
+def write(counts):
+    tmp_path = WORK_COUNTS.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as counts_fo:
+        pickle.dump(counts, counts_fo)
+    os.replace(tmp_path, WORK_COUNTS)
+
+# Return {genre: count} for the genres whose counts are current, and a
+# list of the genres that need recounting.
+def cached(genres):
+    counts, stale = {}, []
+    entries = read()
+    for genre in genres:
+        entry = entries.get(genre)
+        if entry is not None and entry[0] == stamp(genre):
+            counts[genre] = entry[1]
+        else:
+            stale.append(genre)
+    return counts, stale
+
+# Count genres without touching the cache, so that this can run on a
+# worker thread. Stamp before counting: if the file changes in between,
+# the entry is stale rather than wrong.
+def recount(genres):
+    entries = {}
+    for genre in genres:
+        genre_stamp = stamp(genre)
+        entries[genre] = (genre_stamp, shortfile.count(Path(SHORT, genre)))
+    return entries
+
+def store(entries):
+    counts = read()
+    counts.update(entries)
+    write(counts)
+
+# short/<genre> was just written with count works (or count them).
+def update(genre, count=None):
+    if count is None:
+        store(recount([genre]))
+    else:
+        store({genre: (stamp(genre), count)})
+
+# Renaming short/<genre> keeps its stamp.
+def rename(old_genre, new_genre):
+    counts = read()
+    if old_genre in counts:
+        counts[new_genre] = counts.pop(old_genre)
+        write(counts)
+
+def delete(genre):
+    counts = read()
+    if counts.pop(genre, None) is not None:
+        write(counts)
@@ -34,6 +34,7 @@ class CompletersBox(Gtk.Box):
         self.set_name('completers-page')
 
         self.populate()
+        config.subscribe('completers', self.on_completers_changed)
 
         self.connect('realize', self.on_realize)
 
@@ -67,6 +68,7 @@ class CompletersBox(Gtk.Box):
         self.completers_liststore.append(row)
 
         # Create the completer file.
+        checkpoint.wait()
         with open(Path(COMPLETERS, new_completer), 'w') as completer_fo:
             pass
 
@@ -103,6 +105,7 @@ class CompletersBox(Gtk.Box):
 
         self.completers_liststore.remove(treeiter)
 
+        checkpoint.wait()
         Path(COMPLETERS, del_completer).unlink()
 
         with config.modify('completers') as completers:
@@ -128,6 +131,7 @@ class CompletersBox(Gtk.Box):
             completers[new_name] = completers[old_name]
             del completers[old_name]
 
+        checkpoint.wait()
         Path(COMPLETERS, old_name).rename(Path(COMPLETERS, new_name))
 
         # Re-populate to sort names.
@@ -162,14 +166,33 @@ class CompletersBox(Gtk.Box):
                     completers[completer_file] = True
 
         for completer_file in sorted(Path(COMPLETERS).iterdir()):
-            with open(completer_file, 'r') as completer_fo:
-                lines = completer_fo.readlines()
             key = completer_file.name
             enabled, learn = config.completers[key]
-            n_names = len(lines)
-            row = (key, enabled, learn, n_names)
+            row = (key, enabled, learn, count_names(key))
             self.completers_liststore.append(row)
 
+    # After undo, update the rows of the completers that changed. Undo also
+    # restores their files, so count their names again.
+    def on_completers_changed(self, change):
+        liststore = self.completers_liststore
+        if change.key is None:
+            self.populate()
+            return
+        for row in liststore:
+            if row[0] == change.key:
+                if change.new is None:
+                    liststore.remove(row.iter)
+                else:
+                    enabled, learn = change.new
+                    liststore[row.path] = (change.key, enabled, learn,
+                            count_names(change.key))
+                return
+        if change.new is not None:
+            enabled, learn = change.new
+            index = sum(1 for key, *rest in liststore if key < change.key)
+            liststore.insert(index,
+                    (change.key, enabled, learn, count_names(change.key)))
+
     def display_warning(self, message):
         markup = f'<span foreground="#dc143c">{message}</span>'
         GLib.idle_add(undo_box.undo_label.set_markup, markup)
@@ -177,10 +200,18 @@ class CompletersBox(Gtk.Box):
 
     def _push_checkpoint(self, *args):
         comment = checkpoint.make_comment(*args)
+        config.flush()
         checkpoint.push_checkpoint(comment)
         undo_box.undo_label.set_markup(comment)
         undo_box.undo_button.set_sensitive(True)
 
 
+def count_names(key):
+    try:
+        with open(Path(COMPLETERS, key), 'r') as completer_fo:
+            return len(completer_fo.readlines())
+    except FileNotFoundError:
+        return 0
+
 page_widget = CompletersBox()
 
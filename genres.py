@@ -1,7 +1,4 @@
-import os
 import pickle
-import shelve
-import shutil
 from pathlib import Path
 
 import gi
@@ -11,11 +8,17 @@ from gi.repository import Gdk
 from gi.repository import GLib
 
 import common.checkpoint as checkpoint
+import common.shortfile as shortfile
+import common.stats as stats
+import common.workcount as workcount
+import migrations
 from emissionstopper import add_emission_stopper, stop_emission
 from genrespec import genre_spec
+from migrations import RenameGenre, DeleteGenre
 from operations import operations
+from operations import adjust_metadata_files
+from operations import estimate
 from common.constants import METADATA, LONG, SHORT, NOEXPAND
-from common.constants import SOUND, IMAGES, DOCUMENTS
 from common.utilities import debug
 from common.utilities import config
 from common.utilities import make_unique
@@ -26,6 +29,9 @@ DEFAULT_KEY = 'new_key'
 CONFIG_SECTIONS = ('column widths', 'filter config', 'random config',
                 'sort indicators')
 
+# Ask before a key operation that is estimated to take this long.
+CONFIRM_SECONDS = 5
+
 @Gtk.Template.from_file('glade/genres.glade')
 class GenresBox(Gtk.Box):
     __gtype_name__ = 'genres_box'
@@ -88,6 +94,11 @@ class GenresBox(Gtk.Box):
         # Populate genre liststore.
         self.populate()
 
+        # After undo, update just what changed.
+        config.subscribe('genre spec', self.on_genre_spec_changed)
+        for section in ('column widths', 'filter config', 'sort indicators'):
+            config.subscribe(section, self.on_genre_config_changed)
+
     def populate(self):
         genre_liststore = self.genre_liststore
         genre_treeselection = self.genre_treeselection
@@ -120,40 +131,71 @@ class GenresBox(Gtk.Box):
 
         if treeiter is not None:
             self.genre = genre = model.get_value(treeiter, 0)
-
-            for liststore in self.models.values():
-                liststore.clear()
-
-            if genre in genre_spec: # could be a new genre
-                liststore = self.models['primary']
-                keys = config.genre_spec[genre]['primary']
-                column_widths = config.column_widths[genre]
-                filter_buttons = [False] * len(keys)
-                for fb in config.filter_config[genre]:
-                    filter_buttons[fb] = True
-                if genre not in config.sort_indicators:
-                    sort_indicators = [False] * len(keys)
-                else:
-                    sort_indicators = config.sort_indicators[genre]
-
-                for k, cw, fb, cs in \
-                        zip(keys, column_widths, filter_buttons, sort_indicators):
-                    with stop_emission(liststore, 'row-changed'):
-                        liststore.append([k, cw, fb, True, cs])
-
-                liststore = self.models['secondary']
-                for key in config.genre_spec[genre]['secondary']:
-                    liststore.append((key,))
-
+            self.show_keys(genre)
             self.delete_genre_button.set_sensitive(True)
-            self.delete_key_primary_button.hide()
-            self.delete_key_secondary_button.hide()
             GLib.idle_add(self.keys_box.show)
         else:
             self.delete_genre_button.set_sensitive(False)
             self.keys_box.hide()
             self.genre = None
 
+    def show_keys(self, genre):
+        for liststore in self.models.values():
+            liststore.clear()
+
+        if genre in genre_spec: # could be a new genre
+            liststore = self.models['primary']
+            keys = config.genre_spec[genre]['primary']
+            column_widths = config.column_widths[genre]
+            filter_buttons = [False] * len(keys)
+            for fb in config.filter_config[genre]:
+                filter_buttons[fb] = True
+            if genre not in config.sort_indicators:
+                sort_indicators = [False] * len(keys)
+            else:
+                sort_indicators = config.sort_indicators[genre]
+
+            for k, cw, fb, cs in \
+                    zip(keys, column_widths, filter_buttons, sort_indicators):
+                with stop_emission(liststore, 'row-changed'):
+                    liststore.append([k, cw, fb, True, cs])
+
+            liststore = self.models['secondary']
+            for key in config.genre_spec[genre]['secondary']:
+                liststore.append((key,))
+
+        self.delete_key_primary_button.hide()
+        self.delete_key_secondary_button.hide()
+
+    # A genre was added, deleted, or renamed (a deletion and an addition),
+    # or its keys changed. If the genres were reordered, start over.
+    def on_genre_spec_changed(self, change):
+        genre_liststore = self.genre_liststore
+        genre_treeselection = self.genre_treeselection
+        if change.key is None:
+            self.populate()
+        elif change.old is None:
+            index = list(genre_spec).index(change.key)
+            genre_liststore.insert(index, (change.key,))
+        elif change.new is None:
+            for row in genre_liststore:
+                if row[0] == change.key:
+                    with (stop_emission(genre_treeselection, 'changed'),
+                            stop_emission(genre_liststore, 'row-deleted')):
+                        genre_liststore.remove(row.iter)
+                    break
+            if change.key == self.genre:
+                self.delete_genre_button.set_sensitive(False)
+                self.keys_box.hide()
+                self.genre = None
+        elif change.key == self.genre:
+            self.show_keys(self.genre)
+
+    def on_genre_config_changed(self, change):
+        if change.key is None or change.key == self.genre:
+            if self.genre is not None:
+                self.show_keys(self.genre)
+
     # When the scrolledwindow resizes, keep the selected row visible. I get
     # size-allocate whenever the scrolledwindow scrolls, in which case the
     # allocation does not actually change. Do scroll_to_cell only when the
@@ -184,29 +226,28 @@ class GenresBox(Gtk.Box):
         selection = self.genre_treeselection
         GLib.idle_add(selection.select_iter, new_row_iter)
 
-        genre_spec.add_genre(new_genre, DEFAULT_KEY)
-
         # If the files do not exist, create them.
+        checkpoint.wait()
         with (open(LONG, 'ab') as fo_long,
                 open(Path(SHORT, new_genre), 'ab') as fo_short):
             pass
+        workcount.update(new_genre)
 
-        for section, val in (('column widths', [80]),
-                ('filter config', []), ('random config', [0, False]),
-                ('sort indicators', [True])):
-            with config.modify(section) as spec:
-                spec[new_genre] = val
+        with config.transaction():
+            genre_spec.add_genre(new_genre, DEFAULT_KEY)
+            for section, val in (('column widths', [80]),
+                    ('filter config', []), ('random config', [0, False]),
+                    ('sort indicators', [True])):
+                with config.modify(section) as spec:
+                    spec[new_genre] = val
 
     @Gtk.Template.Callback()
     def on_delete_genre_button_clicked(self, selection):
         model, treeiter = selection.get_selected()
         del_genre = model.get_value(treeiter, 0)
 
-        # Warn if short exists and has nonzero size.
-        try:
-            warning = bool(os.path.getsize(Path(SHORT, del_genre)))
-        except OSError:
-            warning = False
+        # Warn if short exists and has at least one work.
+        warning = bool(shortfile.count(Path(SHORT, del_genre)))
 
         if warning:
             dialog = DeleteDialog(del_genre)
@@ -221,13 +262,16 @@ class GenresBox(Gtk.Box):
         with (stop_emission(selection, 'changed'),
                 stop_emission(model, 'row-deleted')):
             model.remove(treeiter)
-        genre_spec.delete_genre(del_genre)
-
+        checkpoint.wait()
         Path(SHORT, del_genre).unlink(missing_ok=True)
+        workcount.delete(del_genre)
+        shortfile.delete_index(del_genre)
 
-        for section in CONFIG_SECTIONS:
-            with config.modify(section) as spec:
-                del spec[del_genre]
+        with config.transaction():
+            genre_spec.delete_genre(del_genre)
+            for section in CONFIG_SECTIONS:
+                with config.modify(section) as spec:
+                    del spec[del_genre]
 
         self.delete_genre_in_long(del_genre)
 
@@ -255,17 +299,21 @@ class GenresBox(Gtk.Box):
 
         self._push_checkpoint('Renamed genre', old_genre, 'to', new_genre)
 
-        genre_spec.rename_genre(old_genre, new_genre)
         self.genre = new_genre
 
         # Rename short and long metadata files.
+        checkpoint.wait()
         orig_file = Path(METADATA, 'short', old_genre)
         orig_file.rename(Path(METADATA, 'short', new_genre))
+        workcount.rename(old_genre, new_genre)
+        shortfile.rename_index(old_genre, new_genre)
 
         # Rename entries in config.
-        for section in CONFIG_SECTIONS:
-            with config.modify(section) as spec:
-                spec[new_genre] = spec.pop(old_genre)
+        with config.transaction():
+            genre_spec.rename_genre(old_genre, new_genre)
+            for section in CONFIG_SECTIONS:
+                with config.modify(section) as spec:
+                    spec[new_genre] = spec.pop(old_genre)
 
         self.rename_genre_in_long(old_genre, new_genre)
 
@@ -305,38 +353,18 @@ class GenresBox(Gtk.Box):
             model[0][4] = True
 
     def rename_genre_in_long(self, old_genre, new_genre):
-        if not os.path.getsize(LONG):
-            return
-        TMP = str(LONG) + '.tmp'
-        with shelve.open(LONG, 'r') as recording_shelf, \
-                shelve.open(TMP, 'n') as tmp_shelf:
-            for uuid, recording in recording_shelf.items():
-                new_works = {}
-                for i, work in recording.works.items():
-                    if work.genre == old_genre:
-                        work = work._replace(genre=new_genre)
-                    new_works[i] = work
-                tmp_shelf[uuid] = recording._replace(works=new_works)
-        Path(TMP).rename(LONG)
+        with (undo_box.monitor(f'Renaming genre {old_genre}'),
+                stats.updated(after=stats.rename_genre(old_genre, new_genre))):
+            migrations.migrate([RenameGenre(old_genre, new_genre)],
+                    in_place=True)
 
     def delete_genre_in_long(self, genre):
-        if not os.path.getsize(LONG):
-            return
-        TMP = str(LONG) + '.tmp'
-        with shelve.open(LONG, 'r') as recording_shelf, \
-                shelve.open(TMP, 'n') as tmp_shelf:
-            for uuid, recording in recording_shelf.items():
-                new_i, new_works = (0, {})
-                for i, work in recording.works.items():
-                    if work.genre != genre:
-                        new_works[new_i] = work
-                        new_i += 1
-                if len(new_works):
-                    tmp_shelf[uuid] = recording._replace(works=new_works)
-                else:
-                    for path in (SOUND, IMAGES, DOCUMENTS):
-                        shutil.rmtree(Path(path, uuid), ignore_errors=True)
-        Path(TMP).rename(LONG)
+        with (undo_box.monitor(f'Deleting genre {genre}'),
+                stats.updated(before=stats.delete_genre(genre),
+                    after=stats.count_recordings)):
+            dropped = migrations.migrate([DeleteGenre(genre)],
+                    in_place=True)
+            migrations.remove_recording_files(dropped)
 
 
     # -Key operations----------------------------------------------------------
@@ -610,9 +638,10 @@ class GenresBox(Gtk.Box):
             'column widths': list(widths),
             'filter config': list(filter_config),
             'sort indicators': list(sorts)}
-        for category, val in new_specs.items():
-            with config.modify(category) as spec:
-                spec.update({genre: val})
+        with config.transaction():
+            for category, val in new_specs.items():
+                with config.modify(category) as spec:
+                    spec.update({genre: val})
 
     def _place_drop(self, treeview, x, y, source_row):
         model = treeview.get_model()
@@ -630,36 +659,27 @@ class GenresBox(Gtk.Box):
 
     def _push_checkpoint(self, *args):
         comment = checkpoint.make_comment(*args)
+        config.flush()
         checkpoint.push_checkpoint(comment)
         undo_box.undo_label.set_markup(comment)
         undo_box.undo_button.set_sensitive(True)
 
-    def adjust_metadata_files(self, func, local_vars):
-        if not os.path.getsize(str(LONG)):
-            return
-
-        if not os.path.getsize(LONG):
-            return
-        short_file_path = Path(SHORT, self.genre)
-        tmp_file_path = short_file_path.with_suffix('.tmp')
-        with (shelve.open(LONG, 'c') as recording_shelf,
-                open(short_file_path, 'rb') as fo_short,
-                open(tmp_file_path, 'wb') as fo_tmp):
-            while True:
-                try:
-                    short_metadata, uuid, work_num = pickle.load(fo_short)
-                except EOFError:
-                    break
-
-                func(list(short_metadata), recording_shelf, uuid, work_num,
-                        fo_tmp, local_vars)
+    # The caller has pushed a checkpoint and changed config, so if the
+    # user declines, undo puts everything back.
+    def adjust_metadata_files(self, op, local_vars):
+        cost = estimate(self.genre, op, local_vars)
+        if cost.seconds >= CONFIRM_SECONDS:
+            dialog = EstimateDialog(self.genre, cost)
+            dialog.set_transient_for(self.get_toplevel())
+            response = dialog.run()
+            dialog.destroy()
+            if response != Gtk.ResponseType.YES:
+                undo_box.undo_button.clicked()
+                return
 
-        # If func put something in tmp_file_path, presumably it was destined
-        # to be renamed short_file_path.
-        if os.path.getsize(tmp_file_path):
-            tmp_file_path.rename(short_file_path)
-        else:
-            tmp_file_path.unlink()
+        with (undo_box.monitor(f'Updating genre {self.genre}'),
+                stats.updated(after=stats.adjust_genre(self.genre))):
+            adjust_metadata_files(self.genre, op, local_vars)
 
     def steal_widths(self, genre):
         new_column_width = 50
@@ -724,6 +744,44 @@ class DeleteDialog(Gtk.Dialog):
         button = self.add_button('No', Gtk.ResponseType.NO)
         button.set_can_focus(False)
 
+class EstimateDialog(Gtk.Dialog):
+    def __init__(self, genre, cost):
+        super().__init__()
+        self.vbox.set_spacing(12)
+        self.vbox.set_margin_start(6)
+        self.vbox.set_margin_end(6)
+
+        label1 = Gtk.Label.new(None)
+        label1.set_markup(
+            '<span size="larger">Updating genre '
+            f'<span foreground="#009185" font="monospace">{genre}</span> '
+            f'will take about {cost.seconds:.0f} seconds.</span>')
+        label1.set_line_wrap(True)
+        label1.set_justify(Gtk.Justification.CENTER)
+        label1.set_margin_top(6)
+        label1.show()
+
+        label2 = Gtk.Label.new(None)
+        label2.set_label(
+            f'It rewrites {cost.works} works in {cost.recordings} '
+            f'recordings,\nabout {cost.long_bytes / 2**20:.0f} MB of long '
+            'metadata.')
+        label2.set_justify(Gtk.Justification.CENTER)
+        label2.show()
+
+        label3 = Gtk.Label.new(None)
+        label3.set_label('Proceed?')
+        label3.show()
+
+        self.vbox.pack_start(label1, *NOEXPAND)
+        self.vbox.pack_start(label2, *NOEXPAND)
+        self.vbox.pack_start(label3, *NOEXPAND)
+
+        button = self.add_button('Yes', Gtk.ResponseType.YES)
+        button.set_can_focus(False)
+        button = self.add_button('No', Gtk.ResponseType.NO)
+        button.set_can_focus(False)
+
 
 page_widget = GenresBox()
 
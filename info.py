@@ -1,24 +1,19 @@
-import os
-import pickle
-import shelve
-from collections import defaultdict
-from datetime import datetime
 from operator import itemgetter
-from pathlib import Path
+from threading import Thread
 
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
 from gi.repository import Gdk
+from gi.repository import GLib
 
 from genrespec import genre_spec
 from piechart import PieChart
-from common.constants import SHORT, LONG
+import common.stats as stats
+import common.workcount as workcount
 from common.utilities import config
 from common.utilities import debug
 
-N_ITEMS = 50
-
 @Gtk.Template.from_file('glade/info.glade')
 class InfoBox(Gtk.Box):
     __gtype_name__ = 'info_box'
@@ -38,6 +33,7 @@ class InfoBox(Gtk.Box):
         super().__init__()
         self.tab_text = 'Info'
         self.set_name('info-page')
+        self.pie_chart = None
 
         self.count_works()
         self.list_by_props()
@@ -49,22 +45,27 @@ class InfoBox(Gtk.Box):
         cell = self.number_of_works_color_cellrenderertext
         col.set_cell_data_func(cell, func)
 
+    # Show the cached counts at once. Genres whose short files changed since
+    # they were counted are recounted on a worker thread, and the counts are
+    # shown again when it finishes.
     def count_works(self):
-        nworks_by_genre = defaultdict(int)
-        for genre in genre_spec:
-            short_file_path = Path(SHORT, genre)
-            if not short_file_path.exists():
-                continue
-            with open(short_file_path, 'rb') as fo_short:
-                while True:
-                    try:
-                        pickle.load(fo_short)
-                    except EOFError:
-                        break
-                    nworks_by_genre[genre] += 1
+        counts, stale = workcount.cached(genre_spec)
+        self.show_counts(counts)
+        if stale:
+            Thread(target=self.recount, args=(stale,), daemon=True).start()
+
+    def recount(self, genres):
+        GLib.idle_add(self.on_recounted, workcount.recount(genres))
+
+    def on_recounted(self, entries):
+        workcount.store(entries)
+        counts, stale = workcount.cached(genre_spec)
+        self.show_counts(counts)
 
+    def show_counts(self, counts):
         # Sort by count.
-        nworks_by_genre = dict(sorted(nworks_by_genre.items(),
+        nworks_by_genre = dict(sorted(
+                ((genre, count) for genre, count in counts.items() if count),
                 key=itemgetter(1), reverse=True))
 
         total_works = sum(nworks_by_genre.values())
@@ -84,61 +85,28 @@ class InfoBox(Gtk.Box):
 
             color = tuple(c * ratio for c in color)
 
-        pie_chart = PieChart(piechart_data)
+        if self.pie_chart is not None:
+            self.number_of_works_hbox.remove(self.pie_chart)
+        self.pie_chart = pie_chart = PieChart(piechart_data)
         pie_chart.connect('clicked', self.on_pie_chart_clicked)
         self.number_of_works_hbox.pack_end(pie_chart, True, True, 0)
+        pie_chart.show()
 
     def on_pie_chart_clicked(self, piechart, zone):
         self.number_of_works_treeselection.select_path(zone)
 
     def list_by_props(self):
-        n_recs = 0
-        props_list = []
-        if not os.path.getsize(LONG):
-            self.total_recs_label.set_text(f'(from 0 recordings)')
-            return
-        with shelve.open(LONG, 'r') as recording_shelf:
-            for recording in recording_shelf.values():
-                n_recs += 1
-                props_d = dict(recording.props)
-                date_created = props_d['date created'][0]
-                for work in recording.works.values():
-                    props_d = dict(work.props)
-                    date_played = props_d['date played'][0]
-                    times_played = props_d['times played'][0]
-
-                    metadata = work.metadata
-                    keys = config.genre_spec[work.genre]['primary']
-                    description = '\n'.join(', '.join(name_group)
-                            for key, name_group in zip(keys, metadata))
-
-                    row = (date_played, date_created, times_played,
-                            work.genre, description)
-                    props_list.append(row)
-        self.total_recs_label.set_text(f'(from {n_recs} recordings)')
-
-        def sort_by_date_played(x):
-            return datetime.strptime(x[0], "%Y %b %d") \
-                    if x[0] else datetime.min
-        props_list.sort(key=sort_by_date_played, reverse=True)
-        date_played_getter = itemgetter(0, 3, 4)
-        for item in props_list[:N_ITEMS]:
-            self.date_played_liststore.append(date_played_getter(item))
-
-        def sort_by_date_created(x):
-            return datetime.strptime(x[1], "%Y %b %d") \
-                    if x[1] else datetime.min
-        props_list.sort(key=sort_by_date_created, reverse=True)
-        date_played_getter = itemgetter(1, 3, 4)
-        for item in props_list[:N_ITEMS]:
-            self.date_created_liststore.append(date_played_getter(item))
-
-        def sort_by_times_played(x):
-            return int(x[2]) if x[2] else 0
-        props_list.sort(key=sort_by_times_played, reverse=True)
-        times_played_getter = itemgetter(2, 3, 4)
-        for item in props_list[:N_ITEMS]:
-            self.times_played_liststore.append(times_played_getter(item))
+        summary = stats.load()
+        self.total_recs_label.set_text(
+                f'(from {summary.n_recordings} recordings)')
+        liststores = (self.date_played_liststore,
+                self.date_created_liststore, self.times_played_liststore)
+        for i, liststore in enumerate(liststores):
+            for entry in summary.top(i):
+                keys = config.genre_spec[entry.genre]['primary']
+                description = '\n'.join(', '.join(name_group)
+                        for key, name_group in zip(keys, entry.metadata))
+                liststore.append((entry.value, entry.genre, description))
 
 
 page_widget = InfoBox()
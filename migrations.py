@@ -0,0 +1,243 @@
+"""Apply batches of schema changes to the long shelf in a single pass."""
+
+import os
+import pickle
+import shutil
+from pathlib import Path
+from typing import NamedTuple
+
+import common.checkpoint as checkpoint
+import common.genreindex as genreindex
+import common.progress as progress
+import common.rewritelog as rewritelog
+from common.constants import LONG, SOUND, IMAGES, DOCUMENTS
+from common.constants import PENDING_EDITS
+from common.longstore import open_long
+
+# Each transformation maps a RecordingTuple to a new RecordingTuple, or to
+# None if nothing is left of the recording. The genre transformations also
+# say which recordings they can change according to the genre index
+# (affected) and bring the index up to date (update_index).
+class RenameGenre(NamedTuple):
+    old_genre: str
+    new_genre: str
+
+    def affected(self, index):
+        return index.get(self.old_genre, set())
+
+    def update_index(self, index):
+        if self.old_genre in index:
+            uuids = index.pop(self.old_genre)
+            index.setdefault(self.new_genre, set()).update(uuids)
+
+    def apply(self, recording):
+        new_works = {}
+        for i, work in recording.works.items():
+            if work.genre == self.old_genre:
+                work = work._replace(genre=self.new_genre)
+            new_works[i] = work
+        return recording._replace(works=new_works)
+
+class DeleteGenre(NamedTuple):
+    genre: str
+
+    def affected(self, index):
+        return index.get(self.genre, set())
+
+    def update_index(self, index):
+        index.pop(self.genre, None)
+
+    def apply(self, recording):
+        new_i, new_works = (0, {})
+        for i, work in recording.works.items():
+            if work.genre != self.genre:
+                new_works[new_i] = work
+                new_i += 1
+        if not new_works:
+            return None
+        return recording._replace(works=new_works)
+
+class AddProperty(NamedTuple):
+    prop: str
+
+    def apply(self, recording):
+        new_works = {}
+        for i, work in recording.works.items():
+            props_dict = dict(work.props)
+            if self.prop not in props_dict:  # should happen always
+                props_dict[self.prop] = ('',)
+            new_works[i] = work._replace(props=list(props_dict.items()))
+        return recording._replace(works=new_works)
+
+class DeleteProperty(NamedTuple):
+    prop: str
+
+    def apply(self, recording):
+        new_works = {}
+        for i, work in recording.works.items():
+            props_dict = dict(work.props)
+            props_dict.pop(self.prop, None)
+            new_works[i] = work._replace(props=list(props_dict.items()))
+        return recording._replace(works=new_works)
+
+class RenameProperty(NamedTuple):
+    old_prop: str
+    new_prop: str
+
+    def apply(self, recording):
+        new_works = {}
+        for i, work in recording.works.items():
+            props_dict = dict(work.props)
+            props_dict[self.new_prop] = props_dict.pop(self.old_prop, ('',))
+            new_works[i] = work._replace(props=list(props_dict.items()))
+        return recording._replace(works=new_works)
+
+GENRE_TRANSFORMS = (RenameGenre, DeleteGenre)
+
+TMP = str(LONG) + '.tmp'
+
+# Property edits are queued in PENDING_EDITS instead of being applied one
+# at a time, so that a run of them rewrites LONG once (see flush_pending).
+# The queue is kept out of config, which wax unpickles, and holds plain
+# tuples: ('add', prop), ('delete', prop) or ('rename', old_prop,
+# new_prop). LONG is not touched while edits are queued. The queue file is
+# replaced by rename, so a checkpoint links the queue as it was along with
+# a LONG that matches it, and undo restores both. The file is removed
+# once the queue is empty.
+EDITS = {'add': AddProperty, 'delete': DeleteProperty,
+        'rename': RenameProperty}
+
+def read_pending():
+    try:
+        with open(PENDING_EDITS, 'rb') as edits_fo:
+            return pickle.load(edits_fo)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return []
+
+def queue(kind, *props):
+    edits = read_pending() + [(kind, *props)]
+    checkpoint.wait()
+    tmp_path = PENDING_EDITS.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as edits_fo:
+        pickle.dump(edits, edits_fo)
+    os.replace(tmp_path, PENDING_EDITS)
+
+# The queued edits as transforms.
+def pending():
+    return [EDITS[kind](*props) for kind, *props in read_pending()]
+
+def flush_pending():
+    if transforms := pending():
+        migrate(transforms, queued=True)
+
+# Clearing the queue and logging the end of the rewrite go together: a
+# rewrite that is resumed after a crash clears the queue when it finishes,
+# so queued edits are never applied twice.
+def clear_pending():
+    checkpoint.wait()
+    PENDING_EDITS.unlink(missing_ok=True)
+
+# Rewrite LONG once, applying transforms in order to every recording.
+# Recordings that the genre index says no transform can change are copied
+# without unpickling them. With in_place, a batch of genre transformations
+# instead updates just the affected records in LONG itself. That is crash
+# safe because checkpoint.journaled saves each before-image in the top
+# checkpoint before the record changes, and progress is logged (see
+# common.rewritelog) so that the rewrite resumes if waxconfig is killed.
+# Return the uuids of the recordings that were dropped. queued says that
+# transforms are the queued edits.
+def migrate(transforms, in_place=False, queued=False):
+    if not transforms or not os.path.getsize(LONG):
+        if queued:
+            clear_pending()
+        return []
+    header = ('migrate', transforms, in_place, queued)
+    with rewritelog.RewriteLog(header) as log:
+        dropped = rewrite(transforms, in_place, log, [])
+        if queued:
+            clear_pending()
+    return dropped
+
+# Finish a migrate that was cut short, and remove the files of the
+# recordings it dropped.
+def resume(progress):
+    kind, transforms, in_place, queued = progress.header
+    checkpoint.roll_back({uuid for uuid, was_dropped in progress.entries})
+    with rewritelog.RewriteLog() as log:
+        if progress.committed:
+            if Path(TMP).exists():
+                Path(TMP).rename(LONG)
+            dropped = [uuid for uuid, was_dropped in progress.entries
+                    if was_dropped]
+        else:
+            dropped = rewrite(transforms, in_place, log, progress.entries)
+        if queued:
+            clear_pending()
+    remove_recording_files(dropped)
+
+# done holds (uuid, was_dropped) for the recordings that are already
+# finished.
+def rewrite(transforms, in_place, log, done):
+    dropped = [uuid for uuid, was_dropped in done if was_dropped]
+    done = {uuid for uuid, was_dropped in done}
+
+    # Only rebuild a stale index if a transform can make use of it.
+    index = genreindex.read()
+    uses_index = [isinstance(t, GENRE_TRANSFORMS) for t in transforms]
+    if index is None and any(uses_index):
+        index = genreindex.rebuild()
+    affected = set() if all(uses_index) else None
+    for transform in transforms:
+        if affected is not None:
+            affected |= transform.affected(index)
+        if index is not None and isinstance(transform, GENRE_TRANSFORMS):
+            transform.update_index(index)
+
+    if in_place and affected is not None:
+        with checkpoint.journaled() as recording_shelf:
+            uuids = sorted(affected - done)
+            for batch in progress.track(rewritelog.batches(uuids),
+                    len(uuids), size=len):
+                finished = []
+                for uuid in batch:
+                    recording = recording_shelf[uuid]
+                    for transform in transforms:
+                        if (recording := transform.apply(recording)) \
+                                is None:
+                            dropped.append(uuid)
+                            del recording_shelf[uuid]
+                            break
+                    else:
+                        recording_shelf[uuid] = recording
+                    finished.append((uuid, recording is None))
+                recording_shelf.sync()
+                log.done(finished)
+    else:
+        # Nothing in LONG changes until TMP replaces it, so if this is cut
+        # short it starts over.
+        with open_long('r') as recording_shelf, \
+                open_long('n', TMP) as tmp_shelf:
+            for uuid, raw in progress.track(recording_shelf.raw_items(),
+                    len(recording_shelf)):
+                if affected is not None and uuid not in affected:
+                    tmp_shelf.set_raw(uuid, raw)
+                    continue
+                recording = pickle.loads(raw)
+                for transform in transforms:
+                    if (recording := transform.apply(recording)) is None:
+                        dropped.append(uuid)
+                        break
+                else:
+                    tmp_shelf[uuid] = recording
+        log.done([(uuid, True) for uuid in dropped])
+        log.commit()
+        Path(TMP).rename(LONG)
+
+    if index is not None:
+        genreindex.write(index)
+    return dropped
+
+def remove_recording_files(uuids):
+    for uuid in uuids:
+        for path in (SOUND, IMAGES, DOCUMENTS):
+            shutil.rmtree(Path(path, uuid), ignore_errors=True)
@@ -7,11 +7,16 @@ gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib
 
 import common.checkpoint as checkpoint
+import common.rewritelog as rewritelog
+import migrations
+import operations
 from commandline import args
 from common.utilities import debug, tracer
 from common.utilities import config
 from undobox import undo_box
 
+RESUME = {'adjust': operations.resume, 'migrate': migrations.resume}
+
 @Gtk.Template.from_file('glade/notebook.glade')
 class Notebook(Gtk.Notebook):
     __gtype_name__ = 'notebook'
@@ -20,6 +25,18 @@ class Notebook(Gtk.Notebook):
         super().__init__()
         self.set_name('notebook')
 
+        # Finish a rewrite of LONG that was cut short. Failing that, if an
+        # operation was cut short, undo it. Config was read on import, so
+        # read it again if recovery restored an older one.
+        if (progress := rewritelog.read()) is not None:
+            RESUME[progress.header[0]](progress)
+        elif checkpoint.recover():
+            config.reread()
+
+        # Apply property edits that were still queued when waxconfig last
+        # stopped.
+        migrations.flush_pending()
+
         # pages will map the name of the page to the page.
         self.pages = pages = {}.fromkeys(['genres', 'properties',
                 'completers', 'parameters', 'info'])
@@ -41,6 +58,9 @@ class Notebook(Gtk.Notebook):
 
         undo_box.undo_button.connect('clicked', self.on_undo_button_clicked)
 
+        checkpoint.compress = args.compress
+        operations.jobs = args.jobs
+
         # Check for command line option to suppress deletion of checkpoints.
         if args.preserve:
             comment = checkpoint.update_comment()
@@ -50,22 +70,29 @@ class Notebook(Gtk.Notebook):
             checkpoint.remove_checkpoints()
 
     def do_switch_page(self, page, page_num):
+        # Leaving the properties page applies its queued edits.
+        properties = self.pages['properties']
+        if properties is not None and self.get_nth_page(
+                self.get_current_page()) is properties.page_widget:
+            properties.page_widget.flush_pending()
+
         undo_box.props.visible = (page_num in [0, 1, 2, 3])
         if not undo_box.props.visible:
             print('Hiding undo_box in notebook.py on page', page_num)
 
         Gtk.Notebook.do_switch_page(self, page, page_num)
 
+    def flush_pending(self):
+        self.pages['properties'].page_widget.flush_pending()
+
     def on_undo_button_clicked(self, button):
         comment = checkpoint.pop_checkpoint()
         undo_box.undo_label.set_markup(comment)
         undo_box.undo_button.set_sensitive(bool(comment))
 
+        # The pages subscribe to the sections of config they show, so
+        # rereading it updates them.
         config.reread()
 
-        for page in self.get_children():
-            if hasattr(page, 'populate'):
-                page.populate()
-
 
 notebook = Notebook()
@@ -1,219 +1,208 @@
+import os
 import pickle
-import re
-from itertools import zip_longest
-
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, repeat
+from multiprocessing import get_context
+from operator import itemgetter
+from pathlib import Path
+from typing import NamedTuple
+
+import common.checkpoint as checkpoint
+import common.genreindex as genreindex
+import common.progress as progress
+import common.rewritelog as rewritelog
+import common.shortfile as shortfile
+import common.workcount as workcount
+from common.constants import LONG, SHORT
+from common.keyoperations import operations
+from common.keyoperations import adjust_recording, adjust_shard
+from common.longstore import PROTOCOL, open_long
 from common.utilities import debug
-from common.utilities import Value
 
 DEFAULT_GENRE = 'New_genre'
 DEFAULT_KEY = 'new_key'
-#DEFAULT_VALUE = lambda new_key: f'*{new_key}*'
-DEFAULT_VALUE = lambda new_key: ''
-NULLVALUE = ('',)
-
-OMIT_FORENAMES = (r'(?u)[\w\s&,-]+\s+(?!I{2,3}$|[JS]r\.*$)', '')
-
-operations = {}
-
-def operation(f):
-    operation_name = f.__name__
-    operations[operation_name] = f
-    return f
-
-def abbrev(name):
-    if name == NULLVALUE:
-        return name
-    pattern, replacement = OMIT_FORENAMES
-    return re.sub(pattern, replacement, name)
-
-@operation
-def add_key(short_metadata, recording_shelf, uuid, work_num, fo_tmp,
-        local_vars):
-    new_key = local_vars['new_key']
-    is_primary = local_vars['is_primary']
-
-    recording_tuple = recording_shelf[uuid]
-    work = recording_tuple.works[work_num]
-
-    # If new_key is in nonce, use its value. Otherwise, assign
-    # a default value. If I use a value from nonce, I need to
-    # remove it from nonce.
-    nonce_dict = dict(recording_tuple.nonce)
-    if new_key in nonce_dict:
-        new_val = nonce_dict[new_key]
-        del nonce_dict[new_key]
-        work = work._replace(nonce=list(nonce_dict.items()))
-    elif is_primary:
-        new_val = (DEFAULT_VALUE(new_key),)
-    else:
-        new_val = NULLVALUE
-    work.metadata.append(new_val)
-
-    recording_shelf[uuid] = recording_tuple
-
-    if is_primary:
-        short_metadata.append((abbrev(new_val[0]),))
-        pickle.dump((tuple(short_metadata), uuid, work_num), fo_tmp)
-
-@operation
-def delete_key(short_metadata, recording_shelf, uuid, work_num, fo_tmp,
-        local_vars):
-    del_key = local_vars['del_key']
-    is_primary = local_vars['is_primary']
-    all_keys = local_vars['all_keys']
-
-    recording_tuple = recording_shelf[uuid]
-    work = recording_tuple.works[work_num]
-
-    # Remove the value corresponding to del_key from metadata
-    # and move it to nonce.
-    long_metadata = work.metadata
-    value_dict = dict(zip(all_keys, long_metadata))
-    if del_val := value_dict.pop(del_key):
-        recording_tuple.nonce.append(del_val)
-        work = work._replace(metadata=list(value_dict.values()))
-
-    recording_shelf[uuid] = recording_tuple
-
-    if is_primary:
-        key_val = zip(all_keys, short_metadata)
-        short_metadata = \
-                [v for k, v in key_val if k != del_key]
-        pickle.dump((tuple(short_metadata), uuid, work_num), fo_tmp)
-
-@operation
-def rename_key(short_metadata, recording_shelf, uuid, work_num, fo_tmp,
-        local_vars):
-    new_key = local_vars['new_key']
-    old_key = local_vars['old_key']
-    all_keys = local_vars['all_keys']
-
-    recording_tuple = recording_shelf[uuid]
-    work = recording_tuple.works[work_num]
-    long_metadata = work.metadata
-    value_list = list(map(Value._make,
-            zip_longest(long_metadata, short_metadata,
-                fillvalue=NULLVALUE)))
-    new_metadata_list = []
-
-    # If there is a nonce with the same key, remove the nonce
-    # from recording_tuple.nonce and attach its value to new_key.
-    nonce_dict = dict(work.nonce)
-    nonce_long = nonce_dict.get(new_key, NULLVALUE)
-    if nonce_long != NULLVALUE:
-        del nonce_dict[new_key]
-        work = work._replace(nonce=list(nonce_dict.items()))
-
-    for key, val in zip(all_keys, value_list):
-        if key == old_key:
-            # We already replaced old_key with new_key above. Now
-            # derive a value to assign to new_key.
-            if val.long == (DEFAULT_VALUE(old_key),):
-                # old_key was newly created, so it was assigned
-                # a default value. If there happens to be a nonce
-                # with new_key, then its value is preferable to
-                # a default value. Otherwise, change the value
-                # to the default value for new_key.
-                new_long = nonce_long if nonce_long != NULLVALUE \
-                        else (DEFAULT_VALUE(new_key),)
-                new_val = Value(new_long, (abbrev(new_long[0]),))
-            else:
-                # old_key was not newly created, so it has a real
-                # value or NULLVALUE. If new_key also happens to
-                # be a nonce, preserve the nonce value by adding
-                # it to the value for old_key.
-                nonce_val = Value(nonce_long, (abbrev(nonce_long[0]),))
-                new_val = val + nonce_val
-        else:
-            # key != old_key, so just copy over the value.
-            new_val = val
-        new_metadata_list.append(new_val)
-
-    new_long_metadata_tuple, new_short_metadata_tuple = \
-            zip(*new_metadata_list)
-    new_short_metadata_list = \
-            list(new_short_metadata_tuple[:len(short_metadata)])
-
-    work = work._replace(metadata=list(new_long_metadata_tuple))
-    recording_shelf[uuid] = recording_tuple
-    pickle.dump((tuple(new_short_metadata_list), uuid, work_num), fo_tmp)
-
-@operation
-def rearrange_primary(short_metadata, recording_shelf, uuid, work_num,
-        fo_tmp, local_vars):
-    from_index = local_vars['from_index']
-    insert_index = local_vars['insert_index']
-
-    recording_tuple = recording_shelf[uuid]
-    work = recording_tuple.works[work_num]
-    long_metadata = work.metadata
-
-    value = long_metadata.pop(from_index)
-    long_metadata.insert(insert_index, value)
-
-    value = short_metadata.pop(from_index)
-    short_metadata.insert(insert_index, value)
-
-    work = work._replace(metadata=long_metadata)
-    recording_shelf[uuid] = recording_tuple
-
-    pickle.dump((tuple(short_metadata), uuid, work_num), fo_tmp)
-
-@operation
-def rearrange_secondary(short_metadata, recording_shelf, uuid, work_num,
-        fo_tmp, local_vars):
-    from_index = local_vars['from_index'] + len(local_vars['primary_keys'])
-    insert_index = local_vars['insert_index'] \
-            + len(local_vars['primary_keys'])
-
-    recording_tuple = recording_shelf[uuid]
-    work = recording_tuple.works[work_num]
-    long_metadata = work.metadata
-
-    value = long_metadata.pop(from_index)
-    long_metadata.insert(insert_index, value)
-
-    work._replace(metadata=long_metadata)
-    recording_shelf[uuid] = recording_tuple
 
-@operation
-def demote_primary(short_metadata, recording_shelf, uuid, work_num, fo_tmp,
-        local_vars):
-    from_index = local_vars['from_index']
-    insert_index = local_vars['insert_index']
-
-    recording_tuple = recording_shelf[uuid]
-    work = recording_tuple.works[work_num]
-    long_metadata = work.metadata
-
-    value = long_metadata.pop(from_index)
-    long_metadata.insert(insert_index, value)
-
-    del short_metadata[from_index]
-
-    work = work._replace(metadata=long_metadata)
-    recording_shelf[uuid] = recording_tuple
-
-    pickle.dump((tuple(short_metadata), uuid, work_num), fo_tmp)
-
-@operation
-def promote_secondary(short_metadata, recording_shelf, uuid, work_num,
-        fo_tmp, local_vars):
-    from_index = local_vars['from_index']
-    insert_index = local_vars['insert_index']
-
-    recording_tuple = recording_shelf[uuid]
-    work = recording_tuple.works[work_num]
-    long_metadata = work.metadata
-
-    value = long_metadata.pop(from_index)
-    long_metadata.insert(insert_index, value)
-
-    short_value = tuple(abbrev(v) for v in value)
-    short_metadata.insert(insert_index, short_value)
-
-    work = work._replace(metadata=long_metadata)
-    recording_shelf[uuid] = recording_tuple
-
-    pickle.dump((tuple(short_metadata), uuid, work_num), fo_tmp)
+# Run key operations in this many processes (commandline -j). A genre with
+# fewer than PARALLEL_MIN works is done in this process anyway, because
+# starting the workers would cost more than they save.
+jobs = 1
+PARALLEL_MIN = 5000
+SHARDS_PER_JOB = 4
+
+# Apply op to every work in short/<genre>. The works of a recording are
+# next to each other in the short file, so each recording is read from
+# LONG once, the long step is applied to all of its works, and it is
+# written back once. The short file is then rewritten in one pass from
+# its columns. Progress is logged (see common.rewritelog), so that if
+# waxconfig is killed, the rewrite resumes where it stopped.
+def adjust_metadata_files(genre, op, local_vars):
+    if not os.path.getsize(LONG):
+        return
+
+    header = ('adjust', genre, op.long_step.__name__, picklable(local_vars))
+    with rewritelog.RewriteLog(header) as log:
+        adjust(genre, op, local_vars, log, [])
+
+# Finish an adjust_metadata_files that was cut short. The records that
+# were being rewritten when it stopped are rolled back and redone.
+def resume(progress):
+    kind, genre, name, local_vars = progress.header
+    checkpoint.roll_back({uuid for uuid, values in progress.entries})
+    with rewritelog.RewriteLog() as log:
+        if progress.committed:
+            short_file_path = Path(SHORT, genre)
+            new_file_path = short_file_path.with_suffix('.new')
+            if new_file_path.exists():
+                os.replace(new_file_path, short_file_path)
+                workcount.update(genre)
+        else:
+            adjust(genre, operations[name], local_vars, log,
+                    progress.entries)
+
+# done holds (uuid, values) for the recordings that are already finished,
+# which are the first len(done) recordings in the short file.
+def adjust(genre, op, local_vars, log, done):
+    short_file_path = Path(SHORT, genre)
+    new_file_path = short_file_path.with_suffix('.new')
+    short_columns = shortfile.read_columns(short_file_path)
+    recordings = [(uuid, [work_num for uuid, work_num in works])
+            for uuid, works in groupby(
+                zip(short_columns.uuids, short_columns.work_nums),
+                key=itemgetter(0))]
+    parallel = jobs > 1 and len(short_columns.uuids) >= PARALLEL_MIN \
+            and len({uuid for uuid, work_nums in recordings}) \
+                == len(recordings)
+    values = [value for uuid, recording_values in done
+            for value in recording_values]
+    recordings = recordings[len(done):]
+    with (genreindex.unchanged(),
+            checkpoint.journaled() as recording_shelf):
+        if parallel:
+            values += adjust_parallel(recordings, recording_shelf,
+                    op.long_step, local_vars, log)
+        else:
+            for batch in progress.track(rewritelog.batches(recordings),
+                    len(recordings), size=len):
+                finished = []
+                for uuid, work_nums in batch:
+                    recording_tuple = recording_shelf[uuid]
+                    recording_values = adjust_recording(op.long_step,
+                            local_vars, recording_tuple, work_nums)
+                    recording_shelf[uuid] = recording_tuple
+                    values += recording_values
+                    finished.append((uuid, recording_values))
+                recording_shelf.sync()
+                log.done(finished)
+
+    if op.short_step is None or not short_columns.uuids:
+        return
+    columns = op.short_step(short_columns.columns, values, local_vars)
+    if columns is not None:
+        index = shortfile.write_columns(new_file_path,
+                short_columns._replace(columns=columns))
+        log.commit()
+        os.replace(new_file_path, short_file_path)
+        shortfile.store_index(short_file_path, index)
+        workcount.update(genre, len(short_columns.uuids))
+
+# Split recordings into contiguous shards and let a pool of processes
+# apply long_step to them. The workers get and return raw records, so only
+# this process touches LONG. Results are merged in shard order, so LONG and
+# the short file come out byte for byte as the serial loop would write
+# them. (That needs each uuid to occur once in recordings, which the caller
+# checks.) The workers are spawned rather than forked, because forking a
+# GTK process with threads running is unsafe.
+def adjust_parallel(recordings, recording_shelf, long_step, local_vars, log):
+    if not recordings:
+        return []
+    local_vars = picklable(local_vars)
+    recordings = [(uuid, recording_shelf.get_raw(uuid), work_nums)
+            for uuid, work_nums in recordings]
+    shard_size = -(-len(recordings) // (jobs * SHARDS_PER_JOB))
+    shards = [recordings[i:i + shard_size]
+            for i in range(0, len(recordings), shard_size)]
+    values = []
+    with ProcessPoolExecutor(jobs, mp_context=get_context('spawn')) \
+            as executor:
+        results_by_shard = executor.map(adjust_shard, repeat(long_step),
+                repeat(local_vars), shards)
+        for results in progress.track(results_by_shard, len(recordings),
+                size=len):
+            for uuid, raw, recording_values in results:
+                recording_shelf.set_raw(uuid, raw)
+                values += recording_values
+            recording_shelf.sync()
+            log.done([(uuid, recording_values)
+                    for uuid, raw, recording_values in results])
+    return values
+
+class Estimate(NamedTuple):
+    works: int
+    recordings: int
+    long_bytes: int      # written to LONG, and as much again to the journal
+    short_bytes: int     # written to short/<genre>
+    seconds: float
+
+SAMPLE_SIZE = 200
+
+# Say what adjust_metadata_files(genre, op, local_vars) would do, without
+# changing anything. Counts come from the index of the short file. A
+# sample of the recordings is read, journaled, transformed and written to
+# scratch files, with a store of the same backend as LONG, and the bytes
+# and time are scaled up from the sample. Recordings that are missing
+# from LONG are left out of the sample.
+def estimate(genre, op, local_vars, sample_size=SAMPLE_SIZE):
+    short_file_path = Path(SHORT, genre)
+    if not os.path.getsize(LONG) or not short_file_path.exists():
+        return Estimate(0, 0, 0, 0, 0.0)
+
+    index = shortfile.read_index(short_file_path)
+    recordings = {}
+    for uuid, work_num, offset in index:
+        recordings.setdefault(uuid, []).append(work_num)
+    sample = random.Random(0).sample(list(recordings),
+            min(sample_size, len(recordings)))
+
+    long_bytes = 0
+    with (tempfile.TemporaryDirectory() as scratch_dir,
+            open_long('r') as recording_shelf,
+            open_long('n', Path(scratch_dir, 'long')) as scratch_shelf,
+            open(Path(scratch_dir, 'journal'), 'wb') as fo_journal):
+        start = time.perf_counter()
+        for uuid in sample:
+            if (raw := recording_shelf.get_raw(uuid)) is None:
+                continue
+            fo_journal.write(pickle.dumps((uuid, raw)))
+            fo_journal.flush()
+            recording_tuple = pickle.loads(raw)
+            adjust_recording(op.long_step, local_vars, recording_tuple,
+                    recordings[uuid])
+            raw = pickle.dumps(recording_tuple, PROTOCOL)
+            scratch_shelf.set_raw(uuid, raw)
+            long_bytes += len(raw)
+        seconds = time.perf_counter() - start
+
+    scale = len(recordings) / len(sample) if sample else 0
+    if jobs > 1 and len(index) >= PARALLEL_MIN:
+        seconds /= jobs
+    short_bytes = os.path.getsize(short_file_path) \
+            if op.short_step is not None else 0
+    return Estimate(len(index), len(recordings), round(long_bytes * scale),
+            short_bytes, seconds * scale)
+
+# local_vars is the locals() of a GenresBox method, so it holds self and
+# other GTK objects that cannot be sent to a worker. The operations do not
+# use them.
+def picklable(local_vars):
+    shareable = {}
+    for name, value in local_vars.items():
+        try:
+            pickle.dumps(value)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            continue
+        shareable[name] = value
+    return shareable
 
@@ -25,6 +25,9 @@ class ParametersBox(Gtk.Box):
         self.set_name('parameters-page')
 
         self.populate()
+        config.subscribe('geometry', self.on_geometry_changed)
+        config.subscribe('trackmetadata keys',
+                lambda change: self.populate_trackmetadata_keys())
 
         # import pickle
         # from common.constants import CONFIG
@@ -45,12 +48,23 @@ class ParametersBox(Gtk.Box):
                 'selector_paned_position',
                 'import_paned_position']:
             geometry_liststore.append((key, config.geometry[key]))
+        self.populate_trackmetadata_keys()
 
+    def populate_trackmetadata_keys(self):
         trackmetadata_keys_liststore = self.trackmetadata_keys_liststore
         trackmetadata_keys_liststore.clear()
         for key in config.trackmetadata_keys:
             trackmetadata_keys_liststore.append((key,))
 
+    # After undo, update just the dimensions that changed.
+    def on_geometry_changed(self, change):
+        if change.key is None:
+            self.populate()
+            return
+        for row in self.geometry_liststore:
+            if row[0] == change.key:
+                row[1] = change.new
+
     # -Geometry----------------------------------------------------------------
     @Gtk.Template.Callback()
     def on_geometry_key_cellrendererspin_edited(self, renderer, path, text):
@@ -130,6 +144,7 @@ class ParametersBox(Gtk.Box):
 
     def _push_checkpoint(self, *args):
         comment = checkpoint.make_comment(*args)
+        config.flush()
         checkpoint.push_checkpoint(comment)
         undo_box.undo_label.set_markup(comment)
         undo_box.undo_button.set_sensitive(True)
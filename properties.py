@@ -1,8 +1,6 @@
 """This module displays controls for dealing with genres."""
 
-import shelve
 import shutil
-from pathlib import Path
 
 import gi
 gi.require_version('Gtk', '3.0')
@@ -10,7 +8,10 @@ from gi.repository import Gtk
 from gi.repository import GLib
 
 import common.checkpoint as checkpoint
-from common.constants import SHORT, LONG, NOEXPAND
+import common.stats as stats
+import migrations
+from common.constants import SHORT, NOEXPAND
+from common.longstore import open_long
 from common.utilities import debug
 from common.utilities import make_unique
 from common.utilities import config
@@ -36,6 +37,7 @@ class PropertiesBox(Gtk.Box):
 
         # Populate prop liststore.
         self.populate()
+        config.subscribe('user props', lambda change: self.populate())
 
     def populate(self):
         properties_liststore = self.properties_liststore
@@ -66,7 +68,7 @@ class PropertiesBox(Gtk.Box):
         with config.modify('user props') as user_props:
             user_props.append(add_prop)
 
-        self.add_property_in_long(add_prop)
+        migrations.queue('add', add_prop)
 
     @Gtk.Template.Callback()
     def on_delete_property_button_clicked(self, selection):
@@ -74,9 +76,12 @@ class PropertiesBox(Gtk.Box):
         del_prop = model.get_value(treeiter, 0)
 
         # Check to see whether del_prop has a value assigned in any recording.
-        # If so, warn with a dialog before proceeding with deletion.
+        # If so, warn with a dialog before proceeding with deletion. Queued
+        # edits of del_prop have to be in LONG for that.
+        if any(del_prop in transform for transform in migrations.pending()):
+            self.flush_pending()
         found_value = False
-        with shelve.open(LONG, 'r') as recording_shelf:
+        with open_long('r') as recording_shelf:
             for uuid, recording in recording_shelf.items():
                 props_dict = dict(recording.props)
                 if any(props_dict.get(del_prop, ('',))):
@@ -100,7 +105,7 @@ class PropertiesBox(Gtk.Box):
         with config.modify('user props') as user_props:
             user_props.remove(del_prop)
 
-        self.delete_property_in_long(del_prop)
+        migrations.queue('delete', del_prop)
 
     @Gtk.Template.Callback()
     def on_name_cellrenderertext_edited(self, model, path, text):
@@ -119,7 +124,7 @@ class PropertiesBox(Gtk.Box):
         config.user_props = [prop if prop != old_prop else new_prop
                 for prop in config.user_props]
 
-        self.rename_property_in_long(old_prop, new_prop)
+        migrations.queue('rename', old_prop, new_prop)
 
     @Gtk.Template.Callback()
     def on_properties_treeselection_changed(self, selection):
@@ -130,54 +135,21 @@ class PropertiesBox(Gtk.Box):
     def on_realize(self, arg):
         GLib.idle_add(self.properties_treeselection.unselect_all)
 
-    def add_property_in_long(self, add_prop):
-        TMP = str(LONG) + '.tmp'
-        with shelve.open(LONG, 'r') as recording_shelf, \
-                shelve.open(TMP, 'n') as tmp_shelf:
-            for uuid, recording in recording_shelf.items():
-                new_works = {}
-                for i, work in recording.works.items():
-                    props_dict = dict(work.props)
-                    if add_prop not in props_dict:  # should happen always
-                        props_dict[add_prop] = ('',)
-                    new_props = list(props_dict.items())
-                    new_works[i] = work._replace(props=new_props)
-                tmp_shelf[uuid] = recording._replace(works=new_works)
-        Path(TMP).rename(LONG)
-
-    def delete_property_in_long(self, del_prop):
-        TMP = str(LONG) + '.tmp'
-        with shelve.open(LONG, 'c') as recording_shelf, \
-                shelve.open(TMP, 'n') as tmp_shelf:
-            for uuid, recording in recording_shelf.items():
-                new_works = {}
-                for i, work in recording.works.items():
-                    props_dict = dict(work.props)
-                    try:
-                        del props_dict[del_prop]
-                    except KeyError:
-                        pass
-                    new_props = list(props_dict.items())
-                    new_works[i] = work._replace(props=new_props)
-                tmp_shelf[uuid] = recording._replace(works=new_works)
-        Path(TMP).rename(LONG)
-
-    def rename_property_in_long(self, old_prop, new_prop):
-        TMP = str(LONG) + '.tmp'
-        with shelve.open(LONG, 'r') as recording_shelf, \
-                shelve.open(TMP, 'n') as tmp_shelf:
-            for uuid, recording in recording_shelf.items():
-                new_works = {}
-                for i, work in recording.works.items():
-                    props_dict = dict(work.props)
-                    props_dict[new_prop] = props_dict.pop(old_prop, ('',))
-                    new_props = list(props_dict.items())
-                    new_works[i] = work._replace(props=new_props)
-                tmp_shelf[uuid] = recording._replace(works=new_works)
-        Path(TMP).rename(LONG)
+    # Property edits are queued (see migrations.EDITS) and applied to LONG
+    # together when the page is left or waxconfig quits. If that is
+    # cancelled, the edits stay queued. User props are never among the
+    # props that common.stats ranks, so the stats stay as they are.
+    def flush_pending(self):
+        if not migrations.pending():
+            return
+        checkpoint.wait()
+        with (undo_box.monitor('Updating properties', undo=False),
+                stats.updated()):
+            migrations.flush_pending()
 
     def _push_checkpoint(self, *args):
         comment = checkpoint.make_comment(*args)
+        config.flush()
         checkpoint.push_checkpoint(comment)
         undo_box.undo_label.set_markup(comment)
         undo_box.undo_button.set_sensitive(True)
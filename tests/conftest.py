@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The tests import modules from the top of the repository, and build their
+# databases with the benchmark fixtures.
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(Path(ROOT, 'benchmarks'))]
+
+import fixtures
+
+N_RECORDINGS = 40
+
+# A database in a fresh directory, which is made the working directory
+# because the paths in common.constants are relative.
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fixtures.make_database(N_RECORDINGS, 2)
+    return tmp_path
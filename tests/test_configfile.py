@@ -0,0 +1,66 @@
+import os
+import pickle
+
+import common.configfile as configfile
+from common.constants import CONFIG, CONFIG_CACHE
+
+# wax loads the config with pickle.load, so that format is kept.
+def test_pickle_round_trip(database):
+    data = CONFIG.read_bytes()
+    config = configfile.read(CONFIG)
+    assert dict(config) == pickle.loads(data)
+    configfile.write(CONFIG, config)
+    assert CONFIG.read_bytes() == data
+
+    config['user props'] = ['mood']
+    configfile.write(CONFIG, config)
+    with open(CONFIG, 'rb') as config_fo:
+        assert pickle.load(config_fo)['user props'] == ['mood']
+    assert not CONFIG.with_suffix('.tmp').exists()
+
+# Once the copy is made, sections are decoded as they are used.
+def test_cache(database):
+    before = pickle.loads(CONFIG.read_bytes())
+    configfile.read(CONFIG)
+    assert CONFIG_CACHE.exists()
+
+    sections = configfile.read(CONFIG)
+    assert list(sections) == list(before)
+    assert 'genre spec' in sections
+    assert sections.encoded == set(before)
+    assert sections['genre spec'] == before['genre spec']
+    assert sections.encoded == set(before) - {'genre spec'}
+
+    # Sections that were not used are copied as they were.
+    sections['user props'] = ['mood']
+    del sections['trackmetadata keys']
+    configfile.write(CONFIG, sections)
+    assert sections.encoded == set(before) - {'genre spec',
+            'user props', 'trackmetadata keys'}
+    after = configfile.read(CONFIG)
+    assert after.encoded == set(after)
+    assert after['user props'] == ['mood']
+    assert 'trackmetadata keys' not in after
+    assert after['genre spec'] == before['genre spec']
+    assert dict(after) == pickle.loads(CONFIG.read_bytes())
+
+# What wax writes makes the copy stale.
+def test_stale_cache(database):
+    configfile.read(CONFIG)
+    config = pickle.loads(CONFIG.read_bytes())
+    config['user props'] = ['mood']
+    with open(CONFIG, 'wb') as config_fo:
+        pickle.dump(config, config_fo)
+    stat = os.stat(CONFIG)
+    os.utime(CONFIG, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert configfile.read(CONFIG)['user props'] == ['mood']
+    assert configfile.read(CONFIG).encoded == set(config)
+
+def test_same_raw(database):
+    configfile.read(CONFIG)
+    old = configfile.read(CONFIG)
+    new = configfile.read(CONFIG)
+    assert configfile.same_raw(old, new, 'genre spec')
+    new['genre spec']
+    assert not configfile.same_raw(old, new, 'genre spec')
+    assert not configfile.same_raw({}, new, 'geometry')
@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import pytest
+
+# operations reads config through common.utilities, which needs GTK.
+pytest.importorskip('gi')
+
+import common.shortfile as shortfile
+from common.constants import SHORT
+from common.longstore import open_long
+
+GENRE = 'Jazz'
+LOCAL_VARS = {'from_index': 0, 'insert_index': 1}
+
+def raw_sizes():
+    with open_long('r') as recording_shelf:
+        return {uuid: len(raw) for uuid, raw in recording_shelf.raw_items()}
+
+def test_counts(database):
+    import operations
+    op = operations.operations['rearrange_primary']
+    records = list(shortfile.read_records(Path(SHORT, GENRE)))
+    uuids = {uuid for short_metadata, uuid, work_num in records}
+
+    cost = operations.estimate(GENRE, op, LOCAL_VARS, len(uuids))
+    assert cost.works == len(records)
+    assert cost.recordings == len(uuids)
+    assert cost.short_bytes == Path(SHORT, GENRE).stat().st_size
+
+    # With every recording in the sample, the bytes are exact.
+    operations.adjust_metadata_files(GENRE, op, LOCAL_VARS)
+    sizes = raw_sizes()
+    assert cost.long_bytes == sum(sizes[uuid] for uuid in uuids)
+
+# A short file can name a recording that is not in LONG.
+def test_missing_recording(database):
+    import operations
+    op = operations.operations['rearrange_primary']
+    records = list(shortfile.read_records(Path(SHORT, GENRE)))
+    missing = records[0][1]
+    with open_long('w') as recording_shelf:
+        del recording_shelf[missing]
+
+    cost = operations.estimate(GENRE, op, LOCAL_VARS)
+    assert cost.works == len(records)
+    assert cost.long_bytes > 0
@@ -0,0 +1,98 @@
+from pathlib import Path
+
+import pytest
+
+import common.checkpoint as checkpoint
+from common.constants import LONG
+from common.journal import JournaledShelf, apply_journal, open_marker
+from common.journal import read_journal
+from common.longstore import convert, open_long
+
+def contents():
+    with open_long('r') as recording_shelf:
+        return {uuid: recording_shelf[uuid] for uuid in recording_shelf}
+
+# Change the first two records, delete the third and add one.
+def rewrite(recording_shelf):
+    uuids = sorted(recording_shelf)
+    for uuid in uuids[:2]:
+        recording = recording_shelf[uuid]
+        recording_shelf[uuid] = recording._replace(discids=['changed'])
+        # A second write keeps the first before-image.
+        recording_shelf[uuid] = recording._replace(discids=['again'])
+    del recording_shelf[uuids[2]]
+    recording_shelf['new'] = recording_shelf[uuids[3]]._replace(uuid='new')
+    return uuids
+
+@pytest.fixture(params=['shelve', 'sqlite'])
+def backend(request, database):
+    convert(request.param)
+    return request.param
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_apply_journal_undoes_writes(backend, tmp_path, compress):
+    before = contents()
+    journal_path = Path(tmp_path, 'journal')
+    with JournaledShelf(open_long('w'), journal_path, compress) \
+            as recording_shelf:
+        uuids = rewrite(recording_shelf)
+        assert open_marker(journal_path).exists()
+    assert not open_marker(journal_path).exists()
+
+    entries = list(read_journal(journal_path))
+    assert [key for key, raw in entries] == uuids[:3] + ['new']
+    assert entries[-1][1] is None
+    assert contents() != before
+
+    with open_long('w') as recording_shelf:
+        apply_journal(journal_path, recording_shelf)
+    assert contents() == before
+
+def test_apply_journal_keeps(backend, tmp_path):
+    journal_path = Path(tmp_path, 'journal')
+    with JournaledShelf(open_long('w'), journal_path) as recording_shelf:
+        uuids = rewrite(recording_shelf)
+    after = contents()
+
+    with open_long('w') as recording_shelf:
+        apply_journal(journal_path, recording_shelf, keep={uuids[0]})
+    restored = contents()
+    assert restored[uuids[0]] == after[uuids[0]]
+    assert restored[uuids[1]] != after[uuids[1]]
+    assert 'new' not in restored
+
+def test_undo_restores_journaled_long(backend):
+    checkpoint.remove_checkpoints()
+    before = contents()
+    checkpoint.push_checkpoint('Changed recordings')
+    with checkpoint.journaled() as recording_shelf:
+        rewrite(recording_shelf)
+    assert contents() != before
+
+    checkpoint.pop_checkpoint()
+    assert contents() == before
+    assert not checkpoint.read_manifest()['stack']
+
+# A journaled write that was cut short is undone at startup.
+def test_recover(backend):
+    checkpoint.remove_checkpoints()
+    before = contents()
+    checkpoint.push_checkpoint('Changed recordings')
+    recording_shelf = checkpoint.journaled()
+    rewrite(recording_shelf)
+    recording_shelf.shelf.close()
+    recording_shelf.fo_journal.close()
+
+    assert checkpoint.recover()
+    assert contents() == before
+    assert not checkpoint.recover()
+
+def test_long_is_shared_with_checkpoint(backend):
+    checkpoint.remove_checkpoints()
+    checkpoint.push_checkpoint('Nothing')
+    checkpoint.wait()
+    name = checkpoint.read_manifest()['stack'][-1]['name']
+    linked = [path for path in Path(checkpoint.CHECKPOINTS, name).iterdir()
+            if path.name.startswith(LONG.name)]
+    assert linked
+    assert all(path.stat().st_nlink > 1 for path in linked)
@@ -0,0 +1,73 @@
+import pytest
+
+from common.constants import LONG
+from common.longstore import backend, convert, open_long
+
+def contents():
+    with open_long('r') as recording_store:
+        return {uuid: recording_store[uuid] for uuid in recording_store}
+
+def raw_contents():
+    with open_long('r') as recording_store:
+        return dict(recording_store.raw_items())
+
+def works():
+    with open_long('r') as recording_store:
+        return sorted(recording_store.iter_works())
+
+def genre_index():
+    with open_long('r') as recording_store:
+        return recording_store.genre_index()
+
+# shelve -> sqlite keeps every record, byte for byte.
+def test_round_trip(database):
+    records, raw = contents(), raw_contents()
+    index, all_works = genre_index(), works()
+    assert backend() == 'shelve'
+
+    convert('sqlite')
+    assert backend() == 'sqlite'
+    assert LONG.read_bytes().startswith(b'SQLite format 3')
+    assert contents() == records
+    assert raw_contents() == raw
+    assert genre_index() == index
+    assert works() == all_works
+
+# Converting back needs a dbm that keeps LONG in one file, as the rest of
+# waxconfig does.
+def test_round_trip_back(database):
+    pytest.importorskip('dbm.gnu')
+    records, raw = contents(), raw_contents()
+    convert('sqlite')
+    convert('shelve')
+    assert backend() == 'shelve'
+    assert contents() == records
+    assert raw_contents() == raw
+
+def test_write_and_delete(database):
+    convert('sqlite')
+    records = contents()
+    uuid, recording = next(iter(records.items()))
+    changed = recording._replace(works={0: recording.works[0]._replace(
+            genre='Blues')})
+    with open_long('w') as recording_store:
+        recording_store[uuid] = changed
+        del recording_store[next(reversed(records))]
+    assert uuid in genre_index()['Blues']
+    assert len(contents()) == len(records) - 1
+    assert [work.genre for work in works() if work.uuid == uuid] == ['Blues']
+
+    with open_long('r') as recording_store:
+        with pytest.raises(KeyError):
+            recording_store['missing']
+
+# The with block of a store that raises leaves LONG as it was.
+def test_rollback(database):
+    convert('sqlite')
+    records = contents()
+    with pytest.raises(RuntimeError):
+        with open_long('w') as recording_store:
+            for uuid in records:
+                del recording_store[uuid]
+            raise RuntimeError
+    assert contents() == records
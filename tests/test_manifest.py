@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import common.checkpoint as checkpoint
+from common.checkpoint import CHECKPOINTS, MANIFEST
+from common.constants import METADATA, SHORT
+
+def test_round_trip(database):
+    checkpoint.remove_checkpoints()
+    manifest = {'next': 3, 'stack': [
+            {'name': '1', 'comment': 'one', 'size': 10, 'time': 1.0,
+                'compressed': False},
+            {'name': '2', 'comment': 'two', 'size': 20, 'time': 2.0,
+                'compressed': True}]}
+    checkpoint.write_manifest(manifest)
+    assert checkpoint.read_manifest() == manifest
+    assert not MANIFEST.with_suffix('.tmp').exists()
+    assert checkpoint.top_comment(manifest) == 'two'
+
+# Checkpoints kept with --preserve from before the manifest existed.
+def test_legacy_manifest(database):
+    checkpoint.remove_checkpoints()
+    for n, comment in enumerate(['one', 'two'], 1):
+        Path(CHECKPOINTS, str(n)).mkdir()
+        Path(CHECKPOINTS, str(n), '.comment').write_text(comment)
+    manifest = checkpoint.read_manifest()
+    assert manifest['next'] == 3
+    assert [(entry['name'], entry['comment'])
+            for entry in manifest['stack']] == [('1', 'one'), ('2', 'two')]
+
+    # The first push writes the manifest.
+    checkpoint.push_checkpoint('three')
+    checkpoint.wait()
+    assert MANIFEST.exists()
+    assert [entry['name'] for entry in checkpoint.read_manifest()['stack']] \
+            == ['1', '2', '3']
+
+def test_push_and_pop(database):
+    checkpoint.remove_checkpoints()
+    for comment in ('one', 'two', 'three'):
+        checkpoint.push_checkpoint(comment)
+    checkpoint.wait()
+    manifest = checkpoint.read_manifest()
+    assert manifest['next'] == 4
+    assert [entry['comment'] for entry in manifest['stack']] \
+            == ['one', 'two', 'three']
+    assert all(entry['size'] > 0 for entry in manifest['stack'])
+
+    assert checkpoint.pop_checkpoint() == 'two'
+    assert checkpoint.update_comment() == 'two'
+    assert not Path(CHECKPOINTS, '3').exists()
+
+    # Names are not reused after a pop.
+    checkpoint.push_checkpoint('four')
+    checkpoint.wait()
+    assert [entry['name'] for entry in checkpoint.read_manifest()['stack']] \
+            == ['1', '2', '4']
+
+def test_evict(database, monkeypatch):
+    monkeypatch.setattr(checkpoint, 'MAX_DEPTH', 2)
+    checkpoint.remove_checkpoints()
+    for comment in ('one', 'two', 'three'):
+        checkpoint.push_checkpoint(comment)
+    checkpoint.wait()
+    stack = checkpoint.read_manifest()['stack']
+    assert [entry['comment'] for entry in stack] == ['two', 'three']
+    assert not Path(CHECKPOINTS, '1').exists()
+
+# Only the temporary files that waxconfig makes are left out of a
+# checkpoint, not a genre that happens to be named like one.
+def test_transient(database):
+    for name in ('Jazz.new', 'Jazz.tmp', 'Op.new.2'):
+        Path(SHORT, name).touch()
+    Path(METADATA, 'stats.tmp').touch()
+    checkpoint.remove_checkpoints()
+    checkpoint.push_checkpoint('one')
+    checkpoint.wait()
+    saved = Path(CHECKPOINTS, '1')
+    assert not Path(saved, 'short', 'Jazz.new').exists()
+    assert not Path(saved, 'short', 'Jazz.tmp').exists()
+    assert not Path(saved, 'stats.tmp').exists()
+    assert Path(saved, 'short', 'Op.new.2').exists()
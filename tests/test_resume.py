@@ -0,0 +1,137 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# migrations and operations read config through common.utilities, which
+# needs GTK.
+pytest.importorskip('gi')
+
+import fixtures
+from common.constants import LONG, SHORT
+from common.longstore import open_long
+from conftest import N_RECORDINGS
+
+KILLED = 9
+
+# Each test runs its code in a child process after this, starting from a
+# fresh checkpoint as the GUI does. kill_after(cls, name, n) kills the
+# child (os._exit) when the n-th call of method name of cls returns.
+PRELUDE = '''
+import os
+import common.checkpoint as checkpoint
+import common.rewritelog as rewritelog
+import migrations
+import operations
+from migrations import RenameGenre
+
+rewritelog.SYNC_EVERY = 5
+checkpoint.remove_checkpoints()
+checkpoint.push_checkpoint('Before')
+checkpoint.wait()
+
+def kill_after(cls, name, n):
+    method = getattr(cls, name)
+    calls = []
+    def die(*args):
+        result = method(*args)
+        calls.append(name)
+        if len(calls) == n:
+            os._exit(%d)
+        return result
+    setattr(cls, name, die)
+''' % KILLED
+
+def run_killed(code):
+    result = subprocess.run([sys.executable, '-c', PRELUDE + code],
+            env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)},
+            capture_output=True, text=True)
+    assert result.returncode == KILLED, result.stderr
+
+# Resume the rewrite as notebook does at startup.
+def resume():
+    import common.rewritelog as rewritelog
+    import migrations
+    import operations
+    from common.utilities import config
+    config.load()
+    progress = rewritelog.read()
+    assert progress is not None
+    resume = {'adjust': operations.resume, 'migrate': migrations.resume}
+    resume[progress.header[0]](progress)
+    assert rewritelog.read() is None
+    return progress
+
+def state():
+    with open_long('r') as recording_shelf:
+        records = {uuid: recording_shelf[uuid] for uuid in recording_shelf}
+    short = {path.name: path.read_bytes() for path in SHORT.iterdir()}
+    return records, short
+
+# The state after running code without interruption, in a fresh database.
+def reference(tmp_path, monkeypatch, code):
+    import common.checkpoint as checkpoint
+    import migrations
+    import operations
+    from migrations import RenameGenre
+    from common.utilities import config
+    reference_path = Path(tmp_path, 'reference')
+    reference_path.mkdir()
+    with monkeypatch.context() as context:
+        context.chdir(reference_path)
+        fixtures.make_database(N_RECORDINGS, 2)
+        config.load()
+        checkpoint.remove_checkpoints()
+        checkpoint.push_checkpoint('Before')
+        exec(code)
+        checkpoint.wait()
+        return state()
+
+def check_resume(tmp_path, monkeypatch, code, kill):
+    expected = reference(tmp_path, monkeypatch, code)
+    run_killed(kill + code)
+    progress = resume()
+    assert state() == expected
+    return progress
+
+GENRE = "migrations.migrate([RenameGenre('Jazz', 'Blues')], in_place=True)"
+
+def test_migrate_in_place(database, tmp_path, monkeypatch):
+    progress = check_resume(tmp_path, monkeypatch, GENRE,
+            "kill_after(rewritelog.RewriteLog, 'done', 2)\n")
+    assert progress.entries and not progress.committed
+
+def test_migrate_committed(database, tmp_path, monkeypatch):
+    code = "migrations.migrate([RenameGenre('Jazz', 'Blues')])"
+    progress = check_resume(tmp_path, monkeypatch, code,
+            "kill_after(rewritelog.RewriteLog, 'commit', 1)\n")
+    assert progress.committed
+    assert not Path(str(LONG) + '.tmp').exists()
+
+ADJUST = ("operations.adjust_metadata_files('Jazz', "
+        "operations.operations['rearrange_primary'], "
+        "{'from_index': 0, 'insert_index': 2})")
+
+def test_adjust(database, tmp_path, monkeypatch):
+    progress = check_resume(tmp_path, monkeypatch, ADJUST,
+            "kill_after(rewritelog.RewriteLog, 'done', 2)\n")
+    assert progress.entries and not progress.committed
+
+def test_adjust_committed(database, tmp_path, monkeypatch):
+    progress = check_resume(tmp_path, monkeypatch, ADJUST,
+            "kill_after(rewritelog.RewriteLog, 'commit', 1)\n")
+    assert progress.committed
+
+# Queued property edits are applied once, even if waxconfig was killed
+# after LONG was rewritten but before the queue was cleared.
+def test_queued_edits(database, tmp_path, monkeypatch):
+    import migrations
+    code = ("migrations.queue('add', 'a')\n"
+            "migrations.queue('rename', 'a', 'b')\n"
+            "migrations.flush_pending()\n")
+    progress = check_resume(tmp_path, monkeypatch, code,
+            "migrations.clear_pending = lambda: os._exit(%d)\n" % KILLED)
+    assert progress.committed
+    assert not migrations.pending()
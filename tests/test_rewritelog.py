@@ -0,0 +1,76 @@
+import pickle
+
+import pytest
+
+import common.progress as progress
+import common.rewritelog as rewritelog
+from common.constants import REWRITE_LOG
+
+HEADER = ('adjust', 'Jazz', 'add_key', {'new_key': 'x'})
+
+# Leave the log as a killed process would: written but not removed.
+def kill(log):
+    log.fo_log.close()
+
+def test_round_trip(database):
+    log = rewritelog.RewriteLog(HEADER)
+    log.done([('a', [1]), ('b', [2])])
+    log.done([])
+    log.done([('c', [3])])
+    kill(log)
+
+    read = rewritelog.read()
+    assert read == rewritelog.Progress(HEADER,
+            [('a', [1]), ('b', [2]), ('c', [3])], False)
+
+    # A resumed rewrite adds to the same log.
+    log = rewritelog.RewriteLog()
+    log.done([('d', [4])])
+    log.commit()
+    kill(log)
+    read = rewritelog.read()
+    assert read.committed
+    assert [uuid for uuid, values in read.entries] == ['a', 'b', 'c', 'd']
+
+def test_close_removes_log(database):
+    with rewritelog.RewriteLog(HEADER) as log:
+        log.done([('a', [1])])
+        assert REWRITE_LOG.exists()
+    assert not REWRITE_LOG.exists()
+    assert rewritelog.read() is None
+
+    with pytest.raises(RuntimeError):
+        with rewritelog.RewriteLog(HEADER):
+            raise RuntimeError
+    assert rewritelog.read() is None
+
+# The last entry is cut short if the process died while writing it.
+def test_torn_entry(database):
+    log = rewritelog.RewriteLog(HEADER)
+    log.done([('a', [1])])
+    kill(log)
+    with open(REWRITE_LOG, 'ab') as fo_log:
+        fo_log.write(pickle.dumps(('b', [2]))[:-3])
+    assert rewritelog.read().entries == [('a', [1])]
+
+def test_empty_log(database):
+    REWRITE_LOG.touch()
+    assert rewritelog.read() is None
+    assert not REWRITE_LOG.exists()
+
+def test_batches():
+    items = list(range(2 * rewritelog.SYNC_EVERY + 1))
+    batches = rewritelog.batches(items)
+    assert [len(batch) for batch in batches] \
+            == [rewritelog.SYNC_EVERY, rewritelog.SYNC_EVERY, 1]
+    assert [item for batch in batches for item in batch] == items
+
+# Once the log commits, the rewrite can no longer be cancelled.
+def test_commit_ends_cancelling(database):
+    with progress.monitoring(lambda report: None) as monitor:
+        monitor.cancel()
+        with pytest.raises(progress.Cancelled):
+            list(progress.track(range(3)))
+        with rewritelog.RewriteLog(HEADER) as log:
+            log.commit()
+        assert list(progress.track(range(3))) == [0, 1, 2]
@@ -0,0 +1,101 @@
+import pickle
+from pathlib import Path
+
+import pytest
+
+import common.shortfile as shortfile
+from common.constants import SHORT
+
+RECORDS = [(((f'Composer {n}',), (f'Opus {n}',)), f'uuid-{n // 2}', n % 2)
+        for n in range(7)]
+
+@pytest.fixture
+def legacy(database):
+    path = Path(SHORT, 'Jazz')
+    with open(path, 'wb') as fo_short:
+        for record in RECORDS:
+            pickle.dump(record, fo_short)
+    return path
+
+# How wax adds a work.
+def wax_append(path, record):
+    with open(path, 'ab') as fo_short:
+        pickle.dump(record, fo_short)
+
+def test_legacy_round_trip(legacy):
+    data = legacy.read_bytes()
+    assert list(shortfile.read_records(legacy)) == RECORDS
+    shortfile.write_records(legacy, shortfile.read_records(legacy))
+    assert legacy.read_bytes() == data
+
+    shortfile.write_columns(legacy, shortfile.read_columns(legacy))
+    assert legacy.read_bytes() == data
+
+def test_legacy_access(legacy):
+    assert shortfile.count(legacy) == len(RECORDS)
+    assert shortfile.fetch(legacy, 'uuid-1', 1) == RECORDS[3]
+    assert list(shortfile.read_range(legacy, 2, 5)) == RECORDS[2:5]
+    with pytest.raises(KeyError):
+        shortfile.fetch(legacy, 'uuid-9', 0)
+
+def test_legacy_append(legacy):
+    record = ((('New',), ('Opus 99',)), 'uuid-new', 0)
+    shortfile.append(legacy, record)
+    wax_append(legacy, RECORDS[0])
+    assert list(shortfile.read_records(legacy)) \
+            == RECORDS + [record, RECORDS[0]]
+
+def test_columns(legacy):
+    short_columns = shortfile.read_columns(legacy)
+    assert short_columns.uuids == [uuid for row, uuid, n in RECORDS]
+    assert short_columns.work_nums == [n for row, uuid, n in RECORDS]
+    assert short_columns.columns[1] == [row[1] for row, uuid, n in RECORDS]
+
+# The index is kept beside the file, which stays as wax writes it.
+def test_index(legacy):
+    data = legacy.read_bytes()
+    assert shortfile.count(legacy) == len(RECORDS)
+    assert shortfile.index_path(legacy).exists()
+    assert legacy.read_bytes() == data
+    assert shortfile.fetch(legacy, 'uuid-1', 1) == RECORDS[3]
+
+    # What wax appends makes the stored index stale.
+    wax_append(legacy, RECORDS[0])
+    assert shortfile.count(legacy) == len(RECORDS) + 1
+    assert list(shortfile.read_range(legacy, len(RECORDS), None)) \
+            == RECORDS[:1]
+
+    index = shortfile.write_records(legacy, RECORDS)
+    shortfile.store_index(legacy, index)
+    assert shortfile.read_index(legacy) == index
+    assert shortfile.count(legacy) == len(RECORDS)
+
+def test_index_rename(legacy):
+    index = shortfile.read_index(legacy)
+    legacy.rename(Path(SHORT, 'Blues'))
+    shortfile.rename_index('Jazz', 'Blues')
+    assert shortfile.read_index(Path(SHORT, 'Blues')) == index
+    shortfile.delete_index('Blues')
+    assert not shortfile.index_path(Path(SHORT, 'Blues')).exists()
+
+# Records with different numbers of primary keys are an error, not
+# truncated.
+def test_ragged(legacy):
+    wax_append(legacy, ((('Composer',),), 'uuid-9', 0))
+    with pytest.raises(ValueError):
+        shortfile.read_columns(legacy)
+    short_columns = shortfile.ShortColumns([[('a',)], [('b',), ('c',)]],
+            ['uuid-9'], [0])
+    with pytest.raises(ValueError):
+        shortfile.write_columns(legacy, short_columns)
+
+def test_empty(database):
+    path = Path(SHORT, 'Empty')
+    path.touch()
+    assert list(shortfile.read_records(path)) == []
+    assert shortfile.count(path) == 0
+    assert shortfile.read_columns(path) == ([], [], [])
+    assert shortfile.count(Path(SHORT, 'Missing')) == 0
+
+    shortfile.append(path, RECORDS[0])
+    assert list(shortfile.read_records(path)) == RECORDS[:1]
@@ -0,0 +1,34 @@
+import common.stats as stats
+from common.longstore import convert, open_long
+
+def set_props(recording):
+    works = {work_num: work._replace(props=[('times played', ('3',)),
+                ('date played', ('2020 Jan 01',))])
+            for work_num, work in recording.works.items()}
+    return recording._replace(works=works,
+            props=[*recording.props, ('date created', ('2019 Jan 01',))])
+
+# Rewrite LONG with every work tied in every ranking, with the recordings
+# in the given order.
+def rewrite(uuids):
+    with open_long('w') as recording_store:
+        recordings = {uuid: set_props(recording_store[uuid])
+                for uuid in uuids}
+        for uuid in uuids:
+            del recording_store[uuid]
+        for uuid in uuids:
+            recording_store[uuid] = recordings[uuid]
+
+# A rewrite of LONG can reorder it without changing the rankings. (LONG is
+# converted to SQLite, which keeps it in one file like the dbm waxconfig
+# uses.)
+def test_ties_ignore_order(database):
+    convert('sqlite')
+    with open_long('r') as recording_store:
+        uuids = list(recording_store)
+    rewrite(uuids)
+    summary = stats.rebuild()
+    assert len({entry.key for entry in summary.rankings[0]}) == 1
+
+    rewrite(uuids[::-1])
+    assert stats.scan() == summary
@@ -1,7 +1,12 @@
+import contextlib
+from functools import partial
+
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Pango
 
+import common.progress as progress
+from common.utilities import config
 from common.utilities import debug, tracer
 
 @Gtk.Template.from_file('glade/undo.glade')
@@ -9,6 +14,7 @@ class UndoBox(Gtk.Box):
     __gtype_name__ = 'undo_box'
 
     undo_button = Gtk.Template.Child()
+    cancel_button = Gtk.Template.Child()
     undo_label = Gtk.Template.Child()
 
     def __init__(self):
@@ -17,6 +23,7 @@ class UndoBox(Gtk.Box):
         self.set_margin_bottom(3)
         self.set_margin_left(3)
         self.undo_label.set_ellipsize(Pango.EllipsizeMode.END)
+        self.cancel_button.connect('clicked', self.on_cancel_button_clicked)
 
     def show_error_message(self, error_message, value):
         undo_label = self.undo_label.get_label()
@@ -31,5 +38,51 @@ class UndoBox(Gtk.Box):
 
         GLib.timeout_add_seconds(3, restore_undo)
 
+    # Show the progress of the operation in the with block, in place of the
+    # undo button and label, with a button to cancel it. While it runs,
+    # only the cancel button takes input. If it is cancelled, undo rolls
+    # back what it did (the caller pushed a checkpoint before starting),
+    # unless undo is False because a cancelled operation leaves nothing to
+    # roll back.
+    # Config is flushed first, so that if the operation is resumed after a
+    # crash, it finishes against the config it started with.
+    @contextlib.contextmanager
+    def monitor(self, title, undo=True):
+        config.flush()
+        undo_label = self.undo_label.get_label()
+        self.undo_button.hide()
+        self.cancel_button.show()
+        Gtk.grab_add(self.cancel_button)
+        cancelled = False
+        try:
+            with progress.monitoring(partial(self.show_progress, title)):
+                yield
+        except progress.Cancelled:
+            cancelled = True
+        finally:
+            Gtk.grab_remove(self.cancel_button)
+            self.cancel_button.hide()
+            self.undo_button.show()
+            self.undo_label.set_markup(undo_label)
+        if cancelled and undo:
+            self.undo_button.clicked()
+
+    def show_progress(self, title, report):
+        text = f'{title}: {report.done}'
+        if report.total is not None:
+            text += f' of {report.total}'
+        text += f' ({report.rate:.0f} a second'
+        if report.eta is not None:
+            text += f', {report.eta:.0f} s left'
+        self.undo_label.set_text(text + ')')
+
+        # Let GTK draw the label and see a click on the cancel button.
+        while Gtk.events_pending():
+            Gtk.main_iteration()
+
+    def on_cancel_button_clicked(self, button):
+        if progress.monitor is not None:
+            progress.monitor.cancel()
+
 
 undo_box = UndoBox()